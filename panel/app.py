@@ -11,7 +11,9 @@ import time
 import uuid
 from urllib.parse import urlparse
 from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, TypedDict
 
@@ -31,7 +33,7 @@ from .ops import (
     run_wgx_routine_apply,
 )
 from .repos import Repo, allowed_repos, repo_by_key
-from .runner import assert_not_main_branch, run
+from .runner import CmdResult, assert_not_main_branch, run
 
 app = FastAPI(title="agent-control-surface")
 
@@ -65,6 +67,8 @@ if cors_origins:
 BASE_DIR = Path(__file__).resolve().parent
 TEMPLATES = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 JOB_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+# Separate pool for read-only git/gh probes run from inside jobs (JOB_EXECUTOR may be saturated).
+GIT_PROBE_EXECUTOR = ThreadPoolExecutor(max_workers=4)
 JOB_LOCK = threading.Lock()
 JOBS: dict[str, "JobState"] = {}
 JOB_CREATED_AT: dict[str, float] = {}
@@ -78,6 +82,22 @@ MAX_STDOUT_CHARS = MAX_OUTPUT_CHARS
 LAST_APPLY_CONTEXT: dict[str, dict[str, str]] = {}
 BRANCH_HEAD_PREFIX = "# branch.head "
 BRANCH_OID_PREFIX = "# branch.oid "
+# Routine ids are passed to wgx as argv; validated in pydantic's compiled (Rust) regex engine.
+# The length limit is checked first, so oversized ids never reach the regex.
+ROUTINE_ID_PATTERN = r"^[a-zA-Z0-9._-]+$"
+ROUTINE_ID_MAX_LENGTH = 64
+# scp-like ssh remote: user@host:path
+SCP_REMOTE_PATTERN = re.compile(r"^[^@]+@[^:]+:.+")
+BRANCH_NAME_PATTERN = re.compile(r"[A-Za-z0-9._/-]+")
+# Branch names arrive from API requests; longer ones are rejected before any scan.
+BRANCH_NAME_MAX_LENGTH = 255
+PR_URL_PATTERN = re.compile(r"https://github\.com/[^/\s]+/[^/\s]+/pull/\d+")
+# Token variables gh reads itself, in its order of precedence.
+GH_TOKEN_ENV_KEYS = ("GH_TOKEN", "GITHUB_TOKEN")
+# Successful gh preflight checks (install, auth); repo state such as the origin URL is never cached.
+PREFLIGHT_CACHE_TTL_SECONDS = 5 * 60
+PREFLIGHT_CACHE_LOCK = threading.Lock()
+PREFLIGHT_CACHE: dict[tuple[str, tuple[str, ...]], tuple[float, CmdResult]] = {}
 
 
 class JobState(BaseModel):
@@ -155,12 +175,12 @@ class GitRepairStageBReq(BaseModel):
 
 class RoutinePreviewReq(BaseModel):
     repo: str
-    id: str = Field(..., pattern=r"^[a-zA-Z0-9._-]+$")
+    id: str = Field(..., max_length=ROUTINE_ID_MAX_LENGTH, pattern=ROUTINE_ID_PATTERN)
 
 
 class RoutineApplyReq(BaseModel):
     repo: str
-    id: str = Field(..., pattern=r"^[a-zA-Z0-9._-]+$")
+    id: str = Field(..., max_length=ROUTINE_ID_MAX_LENGTH, pattern=ROUTINE_ID_PATTERN)
     confirm_token: str
     preview_hash: str
 
@@ -450,15 +470,32 @@ def api_audit_git_latest(repo: str = Query(...)) -> JSONResponse:
     return JSONResponse(result.model_dump())
 
 
+@dataclass(frozen=True)
+class RoutinesConfig:
+    enabled: bool
+    shared_secret: str
+    public_origin: str
+
+
+@lru_cache(maxsize=1)
+def resolve_routines_config() -> RoutinesConfig:
+    """Routine gate settings, read from the environment once per process."""
+    return RoutinesConfig(
+        enabled=os.getenv("ACS_ENABLE_ROUTINES", "false").lower() in ("true", "1", "yes", "on"),
+        shared_secret=os.getenv("ACS_ROUTINES_SHARED_SECRET", "").strip(),
+        public_origin=os.getenv("ACS_PUBLIC_ORIGIN", "").strip().rstrip("/"),
+    )
+
+
 def check_routines_enabled(request: Request) -> None:
-    enabled = os.getenv("ACS_ENABLE_ROUTINES", "false").lower() in ("true", "1", "yes", "on")
-    if not enabled:
+    config = resolve_routines_config()
+    if not config.enabled:
         raise HTTPException(
             status_code=403,
             detail="Routines are disabled. Set ACS_ENABLE_ROUTINES=true to enable."
         )
 
-    secret = os.getenv("ACS_ROUTINES_SHARED_SECRET", "").strip()
+    secret = config.shared_secret
     if not secret:
         raise HTTPException(
             status_code=403,
@@ -487,8 +524,7 @@ def check_routines_enabled(request: Request) -> None:
     referer = request.headers.get("Referer")
 
     # Trust ACS_PUBLIC_ORIGIN if set (useful behind reverse proxies)
-    public_origin = os.getenv("ACS_PUBLIC_ORIGIN", "").strip().rstrip("/")
-    base_url = public_origin or str(request.base_url).rstrip("/")
+    base_url = config.public_origin or str(request.base_url).rstrip("/")
 
     valid_origin = False
     if origin and origin.rstrip("/") == base_url:
@@ -623,8 +659,13 @@ def run_git_command_sequence(
     allow_failures: set[int] | None = None,
     allow_failure_cmds: set[tuple[str, ...]] | None = None,
     stop_on_error: bool = False,
+    parallel: bool = False,
 ) -> tuple[bool, str, str, int | None, list[str]]:
-    """Run a list of commands, allowing optional failures by index (legacy) or command."""
+    """Run a list of commands, allowing optional failures by index (legacy) or command.
+
+    With parallel=True the commands run concurrently (only for independent, read-only
+    probes); output is still assembled in command order.
+    """
     allow_failures = allow_failures or set()
     allow_failure_cmds = allow_failure_cmds or set()
     combined_stdout: list[str] = []
@@ -632,10 +673,15 @@ def run_git_command_sequence(
     optional_failures: list[str] = []
     ok = True
     last_code: int | None = None
+    prefetched = None
+    if parallel:
+        prefetched = list(
+            GIT_PROBE_EXECUTOR.map(lambda cmd: run(cmd, cwd=path, timeout=timeout), commands)
+        )
     for idx, cmd in enumerate(commands):
-        result = run(cmd, cwd=path, timeout=timeout)
+        result = prefetched[idx] if prefetched is not None else run(cmd, cwd=path, timeout=timeout)
         last_code = result.code
-        cmd_line = format_command_line(list(cmd))
+        cmd_line = format_command_line(cmd)
         cmd_key = tuple(cmd)
         stdout_lines = [cmd_line]
         stdout_value = truncate_text(result.stdout.strip(), 20000) if result.stdout else ""
@@ -657,6 +703,8 @@ def run_git_command_sequence(
     return ok, stdout_combined, stderr_combined, last_code, optional_failures
 
 
+# Remote URLs are stable per repo; both helpers below are pure, so cache them.
+@lru_cache(maxsize=256)
 def get_remote_protocol(remote_url: str) -> str:
     remote_url = remote_url.strip()
     if not remote_url:
@@ -665,11 +713,12 @@ def get_remote_protocol(remote_url: str) -> str:
         return "https"
     if remote_url.startswith("ssh://"):
         return "ssh"
-    if re.match(r"^[^@]+@[^:]+:.+", remote_url):
+    if SCP_REMOTE_PATTERN.match(remote_url):
         return "ssh"
     return "unknown"
 
 
+@lru_cache(maxsize=256)
 def https_remote_to_ssh(remote_url: str) -> str | None:
     if not remote_url.startswith(("http://", "https://")):
         return None
@@ -690,6 +739,21 @@ def allow_remote_rewrite() -> bool:
     return value not in {"0", "false", "no", "off"}
 
 
+def run_preflight_check(cmd: list[str], cwd: Path, timeout: int) -> CmdResult:
+    """Run a publish preflight check, reusing a success for PREFLIGHT_CACHE_TTL_SECONDS."""
+    key = (str(cwd), tuple(cmd))
+    now = time.monotonic()
+    with PREFLIGHT_CACHE_LOCK:
+        entry = PREFLIGHT_CACHE.get(key)
+    if entry is not None and now - entry[0] < PREFLIGHT_CACHE_TTL_SECONDS:
+        return entry[1]
+    result = run(cmd, cwd=cwd, timeout=timeout)
+    if result.code == 0:
+        with PREFLIGHT_CACHE_LOCK:
+            PREFLIGHT_CACHE[key] = (now, result)
+    return result
+
+
 def extract_patch_files(patch: str) -> set[str]:
     files: set[str] = set()
     for line in patch.splitlines():
@@ -720,31 +784,44 @@ def _redact_action_result(r: ActionResult) -> ActionResult:
 
 
 def record_job_result(job_id: str, result: ActionResult) -> None:
-    # Cap stdout/stderr to avoid excessive memory usage
-    updates = {}
-    if len(result.stdout) > MAX_OUTPUT_CHARS:
-        updates["stdout"] = result.stdout[:MAX_OUTPUT_CHARS] + "... (truncated)"
-    if len(result.stderr) > MAX_OUTPUT_CHARS:
-        updates["stderr"] = result.stderr[:MAX_OUTPUT_CHARS] + "... (truncated)"
-
-    # Create truncated copy first (if needed), then redacted copy
-    truncated_result = result.model_copy(update=updates) if updates else result
-
-    # Create redacted copy for in-memory storage (API safety)
-    safe_result = _redact_action_result(truncated_result)
-
-    line = json.dumps(safe_result.model_dump(), ensure_ascii=False)
-    if len(line) > MAX_LOG_LINE_CHARS:
-        line = line[:MAX_LOG_LINE_CHARS] + "... (truncated)"
+    record_job_results(job_id, [result])
+
+
+def record_job_results(job_id: str, results: list[ActionResult]) -> None:
+    """Record results that complete together under a single JOB_LOCK acquisition."""
+    safe_results: list[ActionResult] = []
+    lines: list[str] = []
+    for result in results:
+        # Cap stdout/stderr to avoid excessive memory usage
+        updates = {}
+        if len(result.stdout) > MAX_OUTPUT_CHARS:
+            updates["stdout"] = result.stdout[:MAX_OUTPUT_CHARS] + "... (truncated)"
+        if len(result.stderr) > MAX_OUTPUT_CHARS:
+            updates["stderr"] = result.stderr[:MAX_OUTPUT_CHARS] + "... (truncated)"
+
+        # Create truncated copy first (if needed), then redacted copy
+        truncated_result = result.model_copy(update=updates) if updates else result
+
+        # Create redacted copy for in-memory storage (API safety)
+        safe_result = _redact_action_result(truncated_result)
+
+        # Serialized by pydantic-core directly; no intermediate dict, non-ASCII kept as UTF-8.
+        line = safe_result.model_dump_json()
+        if len(line) > MAX_LOG_LINE_CHARS:
+            line = line[:MAX_LOG_LINE_CHARS] + "... (truncated)"
+        safe_results.append(safe_result)
+        lines.append(line)
 
     with JOB_LOCK:
         job_state = JOBS.get(job_id)
         if job_state:
-            job_state.results.append(safe_result)
-            job_state.log_lines.append(line)
-            if len(job_state.log_lines) > MAX_JOB_LOG_LINES:
-                job_state.log_lines.pop(0)
-    log_action_result(safe_result, job_id=job_id)
+            job_state.results.extend(safe_results)
+            job_state.log_lines.extend(lines)
+            overflow = len(job_state.log_lines) - MAX_JOB_LOG_LINES
+            if overflow > 0:
+                del job_state.log_lines[:overflow]
+    for safe_result in safe_results:
+        log_action_result(safe_result, job_id=job_id)
 
 
 def set_job_status(job_id: str, status: str) -> None:
@@ -803,15 +880,15 @@ def git_status_porcelain(path: Path) -> list[str]:
 
 
 def is_valid_branch_name(name: str) -> bool:
-    if not name or " " in name:
+    # Structural checks are plain string operations and decide most rejects before any regex.
+    if not name or len(name) > BRANCH_NAME_MAX_LENGTH or not name.isascii():
         return False
-    if name.startswith("-") or name.endswith(".lock"):
+    if name[0] in "-./" or name.endswith((".lock", "/", ".")):
         return False
-    if ".." in name or "@" in name or "~" in name or ":" in name or "\\" in name:
+    if ".." in name or "//" in name or "/." in name or "./" in name:
         return False
-    if "//" in name or "/." in name or "./" in name:
-        return False
-    return bool(re.fullmatch(r"[A-Za-z0-9._/-]+", name))
+    # The allowlist also rejects whitespace, "@", "~", ":" and "\\".
+    return BRANCH_NAME_PATTERN.fullmatch(name) is not None
 
 
 def get_status_files(lines: list[str]) -> list[str]:
@@ -922,6 +999,7 @@ def git_remote_diagnose(target: Repo, correlation_id: str) -> ActionResult:
         commands,
         timeout=30,
         allow_failure_cmds=allow_failure_cmds,
+        parallel=True,
     )
     message = "Git diagnose completed." if ok else "Git diagnose completed with errors."
     if optional_failures:
@@ -1590,9 +1668,12 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
         )
         record_job_result(job_id, result)
         return False
-    branch, _ = get_git_state(target.path)
+    # Resolved once and passed to every result below; refreshed only after steps that move HEAD.
+    branch, head = get_git_state(target.path)
     if branch != branch_name:
         checkout = checkout_branch(target.path, branch_name)
+        if checkout.code == 0:
+            branch, head = get_git_state(target.path)
         checkout_result = build_action_result(
             ok=checkout.code == 0,
             action="git.branch",
@@ -1603,12 +1684,12 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
             code=checkout.code,
             error_kind=None if checkout.code == 0 else "git_failed",
             message="Switched branch." if checkout.code == 0 else combine_output(checkout).strip(),
-            repo_path=target.path,
+            branch=branch,
+            head=head,
         )
         record_job_result(job_id, checkout_result)
         if checkout.code != 0:
             return False
-    branch, _ = get_git_state(target.path)
     if branch in {"main", "master"}:
         result = build_action_result(
             ok=False,
@@ -1618,11 +1699,37 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
             message="Refusing to operate on main/master. Create a branch first.",
             error_kind="branch_guard",
             code=1,
-            repo_path=target.path,
+            branch=branch,
+            head=head,
         )
         record_job_result(job_id, result)
         return False
-    remote_check = run(["git", "ls-remote", "--heads", "origin"], cwd=target.path, timeout=60)
+    # Independent read-only preflight checks: start them together, report them in order.
+    # Reachability only. git still asks the server for all heads (ref-prefix refs/heads/) and
+    # applies the branch pattern client-side; it just keeps the recorded output to one line.
+    remote_future = GIT_PROBE_EXECUTOR.submit(
+        run,
+        ["git", "ls-remote", "--heads", "origin", f"refs/heads/{branch_name}"],
+        cwd=target.path,
+        timeout=60,
+    )
+    gh_version_future = GIT_PROBE_EXECUTOR.submit(
+        run_preflight_check,
+        ["gh", "--version"],
+        cwd=target.path,
+        timeout=30,
+    )
+    # gh authenticates from these variables directly; checking them needs no round-trip to GitHub.
+    gh_token_env = next((key for key in GH_TOKEN_ENV_KEYS if os.getenv(key)), None)
+    auth_future = None
+    if gh_token_env is None:
+        auth_future = GIT_PROBE_EXECUTOR.submit(
+            run_preflight_check,
+            ["gh", "auth", "status", "--hostname", "github.com"],
+            cwd=target.path,
+            timeout=30,
+        )
+    remote_check = remote_future.result()
     remote_result = build_action_result(
         ok=remote_check.code == 0,
         action="git.remote",
@@ -1633,12 +1740,13 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
         code=remote_check.code,
         error_kind=None if remote_check.code == 0 else "push_failed",
         message="Remote origin reachable." if remote_check.code == 0 else combine_output(remote_check).strip(),
-        repo_path=target.path,
+        branch=branch,
+        head=head,
     )
-    record_job_result(job_id, remote_result)
     if remote_check.code != 0:
+        record_job_result(job_id, remote_result)
         return False
-    gh_version = run(["gh", "--version"], cwd=target.path, timeout=30)
+    gh_version = gh_version_future.result()
     gh_version_result = build_action_result(
         ok=gh_version.code == 0,
         action="gh.version",
@@ -1653,28 +1761,48 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
             if gh_version.code == 0
             else "gh is missing. Install via apt (recommended) and ensure systemd user services have PATH."
         ),
-        repo_path=target.path,
+        branch=branch,
+        head=head,
     )
-    record_job_result(job_id, gh_version_result)
     if gh_version.code != 0:
+        record_job_results(job_id, [remote_result, gh_version_result])
         return False
-    auth_check = run(["gh", "auth", "status", "--hostname", "github.com"], cwd=target.path, timeout=30)
-    auth_result = build_action_result(
-        ok=auth_check.code == 0,
-        action="gh.auth",
-        repo=target.key,
-        correlation_id=correlation_id,
-        stdout=auth_check.stdout,
-        stderr=auth_check.stderr,
-        code=auth_check.code,
-        error_kind=None if auth_check.code == 0 else "gh_not_auth",
-        message="gh auth ok." if auth_check.code == 0 else combine_output(auth_check).strip(),
-        repo_path=target.path,
-    )
-    record_job_result(job_id, auth_result)
-    if auth_check.code != 0:
+    if auth_future is None:
+        auth_result = build_action_result(
+            ok=True,
+            action="gh.auth",
+            repo=target.key,
+            correlation_id=correlation_id,
+            code=0,
+            message=f"gh auth via {gh_token_env}; status check skipped.",
+            branch=branch,
+            head=head,
+        )
+    else:
+        auth_check = auth_future.result()
+        auth_result = build_action_result(
+            ok=auth_check.code == 0,
+            action="gh.auth",
+            repo=target.key,
+            correlation_id=correlation_id,
+            stdout=auth_check.stdout,
+            stderr=auth_check.stderr,
+            code=auth_check.code,
+            error_kind=None if auth_check.code == 0 else "gh_not_auth",
+            message="gh auth ok." if auth_check.code == 0 else combine_output(auth_check).strip(),
+            branch=branch,
+            head=head,
+        )
+    # The preflight checks finish together; record them as one batch.
+    record_job_results(job_id, [remote_result, gh_version_result, auth_result])
+    if not auth_result.ok:
         return False
-    remote_url = run(["git", "remote", "get-url", "origin"], cwd=target.path, timeout=30)
+    # Always read fresh: it decides whether origin gets rewritten before the push.
+    remote_url = run(
+        ["git", "remote", "get-url", "origin"],
+        cwd=target.path,
+        timeout=30,
+    )
     remote_url_value = remote_url.stdout.strip()
     remote_url_result = build_action_result(
         ok=remote_url.code == 0 and bool(remote_url_value),
@@ -1686,7 +1814,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
         code=remote_url.code,
         error_kind=None if remote_url.code == 0 and remote_url_value else "git_failed",
         message="Remote origin URL resolved." if remote_url.code == 0 and remote_url_value else combine_output(remote_url).strip(),
-        repo_path=target.path,
+        branch=branch,
+        head=head,
     )
     record_job_result(job_id, remote_url_result)
     if remote_url.code != 0 or not remote_url_value:
@@ -1705,7 +1834,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
                 ),
                 error_kind="push_failed",
                 code=1,
-                repo_path=target.path,
+                branch=branch,
+                head=head,
             )
             record_job_result(job_id, result)
             return False
@@ -1722,7 +1852,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
                 ),
                 error_kind="push_failed",
                 code=1,
-                repo_path=target.path,
+                branch=branch,
+                head=head,
             )
             record_job_result(job_id, result)
             return False
@@ -1741,7 +1872,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
                 if rewrite.code == 0
                 else combine_output(rewrite).strip()
             ),
-            repo_path=target.path,
+            branch=branch,
+            head=head,
         )
         record_job_result(job_id, rewrite_result)
         if rewrite.code != 0:
@@ -1758,7 +1890,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
             ),
             error_kind="push_failed",
             code=1,
-            repo_path=target.path,
+            branch=branch,
+            head=head,
         )
         record_job_result(job_id, result)
         return False
@@ -1779,7 +1912,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
                 error_kind="unexpected_changes_no_context",
                 code=1,
                 files=get_status_files(status_lines),
-                repo_path=target.path,
+                branch=branch,
+                head=head,
             )
             record_job_result(job_id, result)
             return False
@@ -1793,7 +1927,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
                 error_kind="git_failed",
                 code=1,
                 files=get_status_files(status_lines),
-                repo_path=target.path,
+                branch=branch,
+                head=head,
             )
             record_job_result(job_id, result)
             return False
@@ -1809,7 +1944,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
             code=add.code,
             error_kind=None if add.code == 0 else "git_failed",
             message="Staged changes." if add.code == 0 else combine_output(add).strip(),
-            repo_path=target.path,
+            branch=branch,
+            head=head,
         )
         record_job_result(job_id, add_result)
         if add.code != 0:
@@ -1825,12 +1961,15 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
                 message="Nothing to commit",
                 error_kind="nothing_to_commit",
                 code=1,
-                repo_path=target.path,
+                branch=branch,
+                head=head,
             )
             record_job_result(job_id, result)
             return False
         commit = run(["git", "commit", "-m", commit_message], cwd=target.path, timeout=60)
         commit_ok = commit.code == 0
+        if commit_ok:
+            branch, head = get_git_state(target.path)
         commit_result = build_action_result(
             ok=commit_ok,
             action="git.commit",
@@ -1843,7 +1982,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
             message="Commit created." if commit_ok else combine_output(commit).strip(),
             changed=commit_ok,
             files=staged_files,
-            repo_path=target.path,
+            branch=branch,
+            head=head,
         )
         record_job_result(job_id, commit_result)
         if not commit_ok:
@@ -1860,12 +2000,14 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
         code=push.code,
         error_kind=None if push_ok else "push_failed",
         message="Push completed." if push_ok else combine_output(push).strip(),
-        repo_path=target.path,
+        branch=branch,
+        head=head,
     )
     record_job_result(job_id, push_result)
     if not push_ok:
         return False
-    head_branch, _ = get_git_state(target.path)
+    # add/commit/push never switch branches, so HEAD is still the branch resolved above.
+    head_branch = branch
     if not head_branch or head_branch == "HEAD":
         result = build_action_result(
             ok=False,
@@ -1875,7 +2017,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
             message="Unable to determine head branch for PR creation (HEAD detached or unknown).",
             error_kind="git_failed",
             code=1,
-            repo_path=target.path,
+            branch=branch,
+            head=head,
         )
         record_job_result(job_id, result)
         return False
@@ -1925,7 +2068,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
         code=upstream.code,
         error_kind=upstream_error_kind,
         message=upstream_message,
-        repo_path=target.path,
+        branch=branch,
+        head=head,
     )
     record_job_result(job_id, upstream_result)
     head_ref_name = upstream_branch or head_branch
@@ -1971,7 +2115,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
         code=fetch.code,
         error_kind=None if fetch.code == 0 else fetch_error_kind,
         message="Fetched remote refs." if fetch.code == 0 else fetch_error,
-        repo_path=target.path,
+        branch=branch,
+        head=head,
     )
     record_job_result(job_id, fetch_result)
     if fetch.code != 0:
@@ -2018,7 +2163,8 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
             if commit_count_ok
             else combine_output(commit_count).strip()
         ),
-        repo_path=target.path,
+        branch=branch,
+        head=head,
     )
     record_job_result(job_id, precheck_result)
     if not precheck_result.ok:
@@ -2063,10 +2209,11 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
         error_kind=pr_error_kind,
         message="PR already exists." if existing_pr else "PR created." if pr_ok else pr_error,
         pr_url=pr_url,
-        repo_path=target.path,
+        branch=branch,
+        head=head,
     )
-    record_job_result(job_id, pr_result)
     if not pr_ok:
+        record_job_result(job_id, pr_result)
         return False
     publish_result = build_action_result(
         ok=True,
@@ -2077,9 +2224,10 @@ def execute_publish(job_id: str, correlation_id: str, repo: str, req: PublishOpt
         pr_url=pr_url,
         code=0,
         duration_ms=int((time.monotonic() - start) * 1000),
-        repo_path=target.path,
+        branch=branch,
+        head=head,
     )
-    record_job_result(job_id, publish_result)
+    record_job_results(job_id, [pr_result, publish_result])
     return True
 
 
@@ -2135,12 +2283,10 @@ def build_default_pr_body(
 
 
 def extract_pr_url(text: str | None) -> str | None:
-    if not text:
+    # Cheap substring reject before running the regex over gh output.
+    if not text or "github.com/" not in text:
         return None
-    match = re.search(
-        r"https://github\.com/[^/\s]+/[^/\s]+/pull/\d+",
-        text,
-    )
+    match = PR_URL_PATTERN.search(text)
     if not match:
         return None
     return match.group(0).rstrip(").,")
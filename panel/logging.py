@@ -20,8 +20,8 @@ SENSITIVE_ENV_KEYS = [
     "ACS_ROUTINES_SHARED_SECRET",
 ]
 
-GHP_PATTERN = re.compile(r"ghp_[A-Za-z0-9]{20,}")
-GITHUB_PAT_PATTERN = re.compile(r"github_pat_[A-Za-z0-9_]{20,}")
+# Classic (ghp_) and fine-grained (github_pat_) GitHub tokens, matched in a single scan.
+GITHUB_TOKEN_PATTERN = re.compile(r"ghp_[A-Za-z0-9]{20,}|github_pat_[A-Za-z0-9_]{20,}")
 # Redact token= and access_token= in any text (URL or not), but avoid matching my_token=
 TOKEN_PATTERN = re.compile(r"(?<![A-Za-z0-9_])(token|access_token)=[^&\s]+")
 
@@ -162,6 +162,8 @@ def _get_sensitive_pattern() -> re.Pattern | None:
 
 
 def redact_secrets(text: str) -> str:
+    if not text:
+        return text
     redacted = text
     # 1. Redact known sensitive environment values (single pass)
     sensitive_pattern = _get_sensitive_pattern()
@@ -169,7 +171,6 @@ def redact_secrets(text: str) -> str:
         redacted = sensitive_pattern.sub("[redacted]", redacted)
 
     # 2. Redact heuristic patterns
-    redacted = GHP_PATTERN.sub("[redacted]", redacted)
-    redacted = GITHUB_PAT_PATTERN.sub("[redacted]", redacted)
+    redacted = GITHUB_TOKEN_PATTERN.sub("[redacted]", redacted)
     redacted = TOKEN_PATTERN.sub(r"\1=[redacted]", redacted)
     return redacted
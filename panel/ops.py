@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import hashlib
+import hmac
 import json
 import os
 import re
+import stat
 import threading
 import time
 import uuid
@@ -20,11 +22,19 @@ from .runner import run
 # Token Store (In-Memory)
 # ------------------------------------------------------------------------------
 
-TOKEN_STORE: dict[str, dict[str, Any]] = {}
+# Keyed by a salted fixed-size digest of the token, so lookup cost and memory do not
+# depend on the length of caller-supplied tokens and raw tokens are not kept around.
+TOKEN_STORE: dict[bytes, dict[str, Any]] = {}
 TOKEN_TTL_SECONDS = 600  # 10 minutes
+TOKEN_MAX_ENTRIES = 1024
+TOKEN_KEY_SALT = os.urandom(16)
 TOKEN_LOCK = threading.Lock()
 
 
+def _token_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode("utf-8"), digest_size=16, key=TOKEN_KEY_SALT).digest()
+
+
 def create_token(data: dict[str, Any]) -> str:
     token = str(uuid.uuid4())
     now = time.time()
@@ -35,37 +45,39 @@ def create_token(data: dict[str, Any]) -> str:
         for k in expired:
             del TOKEN_STORE[k]
 
-        TOKEN_STORE[token] = {"created_at": now, "data": data}
+        # Bound growth under preview churn: drop the oldest (insertion-ordered) tokens
+        while len(TOKEN_STORE) >= TOKEN_MAX_ENTRIES:
+            del TOKEN_STORE[next(iter(TOKEN_STORE))]
+
+        TOKEN_STORE[_token_key(token)] = {"created_at": now, "data": data}
     return token
 
 
 def validate_and_consume_token(token: str, repo_key: str, routine_id: str, preview_hash: str | None = None) -> bool:
     now = time.time()
+    key = _token_key(token)
     with TOKEN_LOCK:
-        if token not in TOKEN_STORE:
+        # Any outcome below consumes the token (expired, mismatch, or valid use)
+        entry = TOKEN_STORE.pop(key, None)
+        if entry is None:
             return False
-        entry = TOKEN_STORE[token]
 
-        # Cleanup if expired
         if now - entry["created_at"] > TOKEN_TTL_SECONDS:
-            del TOKEN_STORE[token]
             return False
 
         data = entry["data"]
-        # Mismatch -> delete token to prevent brute-forcing
+        # Mismatch -> token stays deleted to prevent brute-forcing
         # Use 'repo_key' consistently
         if data.get("repo_key") != repo_key or data.get("routine_id") != routine_id:
-            del TOKEN_STORE[token]
             return False
 
         # Check preview hash if available/required
         stored_hash = data.get("preview_hash")
-        if stored_hash and preview_hash != stored_hash:
-            del TOKEN_STORE[token]
+        if stored_hash and not hmac.compare_digest(
+            (preview_hash or "").encode("utf-8"), stored_hash.encode("utf-8")
+        ):
             return False
 
-        # Valid usage -> delete token (consume)
-        del TOKEN_STORE[token]
         return True
 
 
@@ -135,58 +147,43 @@ def now_iso() -> str:
 # Helpers
 # ------------------------------------------------------------------------------
 
+JSON_DECODER = json.JSONDecoder()
+JSON_SCAN_MAX_STARTS = 50
+
+
 def extract_json_from_stdout(stdout: str) -> Any | None:
     """Find and parse the first valid JSON object/array embedded in noisy stdout."""
     s = stdout.strip()
     if not s:
         return None
 
-    # 1) Fast path: whole stdout is JSON
-    try:
-        return json.loads(s)
-    except Exception:
-        pass
+    # 1) Fast path: whole stdout is JSON (only worth trying if it can be an object/array;
+    #    wgx path/noise output would otherwise pay for a full failed parse)
+    if s[0] in "{[":
+        try:
+            return json.loads(s)
+        except Exception:
+            pass
 
-    # 2) Balanced scanner to find embedded JSON
-    def find_balanced(start_ch: str, end_ch: str) -> Any | None:
-        starts = [i for i, ch in enumerate(s) if ch == start_ch]
+    # 2) Let the JSON decoder act as the bracket matcher: try raw_decode at each
+    #    candidate start; it stops at the end of the first complete value.
+    def scan(start_ch: str) -> Any | None:
+        i = s.find(start_ch)
         # Cap attempts to prevent excessive CPU on massive logs
-        for start in starts[:50]:
-            depth = 0
-            in_str = False
-            esc = False
-            for i in range(start, len(s)):
-                ch = s[i]
-                if in_str:
-                    if esc:
-                        esc = False
-                    elif ch == "\\":
-                        esc = True
-                    elif ch == '"':
-                        in_str = False
-                    continue
-                else:
-                    if ch == '"':
-                        in_str = True
-                        continue
-                    if ch == start_ch:
-                        depth += 1
-                    elif ch == end_ch:
-                        depth -= 1
-                        if depth == 0:
-                            candidate = s[start : i + 1]
-                            try:
-                                return json.loads(candidate)
-                            except Exception:
-                                break  # matched brackets but invalid JSON? try next start
-            # If loop finishes without depth==0, this start was unmatched
+        for _ in range(JSON_SCAN_MAX_STARTS):
+            if i < 0:
+                break
+            try:
+                return JSON_DECODER.raw_decode(s, i)[0]
+            except Exception:
+                i = s.find(start_ch, i + 1)
         return None
 
     # Prefer object, then array
-    obj = find_balanced("{", "}")
+    obj = scan("{")
     if obj is not None:
         return obj
-    arr = find_balanced("[", "]")
+    arr = scan("[")
     if arr is not None:
         return arr
 
@@ -260,6 +257,7 @@ def run_wgx_audit_git(
 
     output = res.stdout.strip()
     audit_data = None
+    audit_raw: bytes | None = None
 
     if stdout_json:
         audit_data = extract_json_from_stdout(output)
@@ -280,8 +278,8 @@ def run_wgx_audit_git(
 
         if target_file:
             try:
-                with open(target_file, "r", encoding="utf-8") as f:
-                    audit_data = json.load(f)
+                with open(target_file, "rb") as f:
+                    audit_raw = f.read()
             except Exception as e:
                 raise RuntimeError(f"Failed to read audit artifact at {target_file}: {e}")
         else:
@@ -294,8 +292,8 @@ def run_wgx_audit_git(
 
             if path_to_read:
                 try:
-                    with open(path_to_read, "r", encoding="utf-8") as f:
-                        audit_data = json.load(f)
+                    with open(path_to_read, "rb") as f:
+                        audit_raw = f.read()
                 except Exception as e:
                     raise RuntimeError(f"Failed to read audit artifact at {path_to_read}: {e}")
             else:
@@ -304,9 +302,12 @@ def run_wgx_audit_git(
                     raise RuntimeError(f"WGX audit failed (code {res.code}) and no JSON artifact found: {detail}")
                 raise RuntimeError(f"Could not locate valid JSON output from wgx. Stdout: {output[:200]}")
 
-    # Validate with Pydantic
+    # Validate with Pydantic (artifact files go straight from bytes via the JSON parser)
     try:
-        audit = AuditGit.model_validate(audit_data)
+        if audit_raw is not None:
+            audit = _parse_audit(audit_raw)
+        else:
+            audit = AuditGit.model_validate(audit_data)
         # Force correlation_id to match the request for consistent tracking
         audit.correlation_id = correlation_id
         return audit
@@ -314,67 +315,100 @@ def run_wgx_audit_git(
         raise RuntimeError(f"Audit artifact validation failed: {e}")
 
 
+def _parse_audit(raw: bytes) -> AuditGit:
+    """Validates an audit.git document directly from JSON bytes (no intermediate dict)."""
+    return AuditGit.model_validate_json(raw)
+
+
+# artifact path -> (mtime_ns, size, parsed audit); shared across repos, oldest evicted first
+PARSED_AUDIT_CACHE: dict[str, tuple[int, int, AuditGit]] = {}
+PARSED_AUDIT_CACHE_MAX_ENTRIES = 64
+
+
+def _load_audit_artifact(path: str, mtime_ns: int, size: int) -> AuditGit:
+    """Parses an artifact file, reusing the previous result while mtime and size are unchanged."""
+    cached = PARSED_AUDIT_CACHE.get(path)
+    if cached and cached[0] == mtime_ns and cached[1] == size:
+        return cached[2]
+    with open(path, "rb") as f:
+        audit = _parse_audit(f.read())
+    while len(PARSED_AUDIT_CACHE) >= PARSED_AUDIT_CACHE_MAX_ENTRIES:
+        PARSED_AUDIT_CACHE.pop(next(iter(PARSED_AUDIT_CACHE)), None)
+    PARSED_AUDIT_CACHE[path] = (mtime_ns, size, audit)
+    return audit
+
+
+# (out_dir, repo_key) -> (dir mtime_ns, chosen artifact path, its mtime_ns, parsed audit)
+ARTIFACT_CACHE: dict[tuple[Path, str | None], tuple[int, str, int, AuditGit]] = {}
+# Results whose directory or chosen file was modified more recently than this are not
+# cached: on coarse-timestamp filesystems a second write within the same tick would not
+# move the mtime.
+ARTIFACT_CACHE_MIN_AGE_NS = 2_000_000_000
+
+
 def get_latest_audit_artifact(repo_path: Path, repo_key: str | None = None) -> AuditGit | None:
     """
     Scans .wgx/out/ for the most recent audit.git.v1.*.json artifact.
     Prioritizes specific correlation-id files over the generic copy if both exist.
     Optional: filters by repo key found inside the artifact.
+
+    The result is cached per directory and reused while neither the directory mtime
+    (new/removed artifacts) nor the chosen file's mtime (in-place rewrite) has changed.
     """
     out_dir = repo_path / ".wgx" / "out"
-    if not out_dir.exists():
+    try:
+        dir_mtime = out_dir.stat().st_mtime_ns
+    except OSError:
         return None
 
-    candidates = []
+    cache_key = (out_dir, repo_key)
+    cached = ARTIFACT_CACHE.get(cache_key)
+    if cached and cached[0] == dir_mtime:
+        try:
+            if os.stat(cached[1]).st_mtime_ns == cached[2]:
+                return cached[3]
+        except OSError:
+            pass
+
+    # Single scandir pass: one stat per matching entry, partitioned as we go.
+    # The generic copy only has one possible name, so it needs no sorting.
+    generic_name = "audit.git.v1.json"
+    specific: list[tuple[int, str, int]] = []
+    generic: list[tuple[int, str, int]] = []
     try:
         with os.scandir(out_dir) as it:
             for entry in it:
-                if entry.name.startswith("audit.git.v1") and entry.name.endswith(".json"):
-                    try:
-                        if entry.is_file():
-                            candidates.append(entry)
-                    except OSError:
-                        continue
+                name = entry.name
+                if not (name.startswith("audit.git.v1") and name.endswith(".json")):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    # Race: file deleted between listing and stat
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                bucket = generic if name == generic_name else specific
+                bucket.append((st.st_mtime_ns, entry.path, st.st_size))
     except (FileNotFoundError, NotADirectoryError):
         return None
 
-    if not candidates:
-        return None
-
-    # Sort by modification time descending
-    # Use cached stat from DirEntry; handle potential race condition if file deleted
-    def safe_mtime(entry: os.DirEntry[str]) -> float:
-        try:
-            return entry.stat().st_mtime
-        except OSError:
-            return 0.0
-
-    candidates.sort(key=safe_mtime, reverse=True)
+    # Newest specific first; older ones are fallbacks for unreadable/foreign artifacts
+    specific.sort(reverse=True)
 
-    generic_name = "audit.git.v1.json"
-    specific = [c for c in candidates if c.name != generic_name]
-    generic = [c for c in candidates if c.name == generic_name]
-
-    # Check specifics first
-    for cand in specific:
+    # Check specifics first, then generic
+    for rank, (mtime_ns, path, size) in enumerate(specific + generic):
         try:
-            with open(cand.path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if repo_key and data.get("repo") != repo_key:
-                    continue
-                return AuditGit.model_validate(data)
+            audit = _load_audit_artifact(path, mtime_ns, size)
         except Exception:
             continue
-
-    # Then generic
-    for cand in generic:
-        try:
-            with open(cand.path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if repo_key and data.get("repo") != repo_key:
-                    continue
-                return AuditGit.model_validate(data)
-        except Exception:
+        if repo_key and audit.repo != repo_key:
             continue
+        # Only cache the top candidate: a skipped one (e.g. still being written) may become
+        # valid in place without touching the directory or the chosen file.
+        if rank == 0 and time.time_ns() - max(dir_mtime, mtime_ns) > ARTIFACT_CACHE_MIN_AGE_NS:
+            ARTIFACT_CACHE[cache_key] = (dir_mtime, path, mtime_ns, audit)
+        return audit
 
     return None
 
@@ -6,7 +6,7 @@ from pathlib import Path
 from typing import Mapping, Sequence
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CmdResult:
     code: int
     stdout: str
@@ -21,8 +21,9 @@ def run(
     env: Mapping[str, str] | None = None,
     input_text: str | None = None,
 ) -> CmdResult:
+    argv = list(cmd)
     result = subprocess.run(
-        list(cmd),
+        argv,
         cwd=str(cwd),
         text=True,
         input=input_text,
@@ -35,7 +36,7 @@ def run(
         code=result.returncode,
         stdout=result.stdout,
         stderr=result.stderr,
-        cmd=list(cmd),
+        cmd=argv,
     )
 
 
@@ -0,0 +1,61 @@
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from panel.app import PREFLIGHT_CACHE, app, resolve_routines_config
+
+
+@pytest.fixture(autouse=True)
+def clear_routines_config():
+    """Routine settings are cached per process; tests change them via env vars."""
+    resolve_routines_config.cache_clear()
+    yield
+    resolve_routines_config.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_preflight_cache():
+    """Successful publish preflight checks are cached per process; tests mock them per case."""
+    PREFLIGHT_CACHE.clear()
+    yield
+    PREFLIGHT_CACHE.clear()
+
+
+@pytest.fixture(autouse=True)
+def no_gh_token_env(monkeypatch):
+    """A token in the environment makes publish skip `gh auth status`; tests opt in explicitly."""
+    monkeypatch.delenv("GH_TOKEN", raising=False)
+    monkeypatch.delenv("GITHUB_TOKEN", raising=False)
+
+
+@pytest.fixture(scope="module")
+def client():
+    """One TestClient per test module; tests that set cookies build their own."""
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def routines_enabled(monkeypatch):
+    """Enables routine endpoints with the shared secret "testsecret"."""
+    monkeypatch.setenv("ACS_ENABLE_ROUTINES", "true")
+    monkeypatch.setenv("ACS_ROUTINES_SHARED_SECRET", "testsecret")
+
+
+@pytest.fixture
+def mock_get_repo(monkeypatch, tmp_path):
+    """Patches get_repo to always return a Repo pointing to tmp_path for CI stability."""
+    from panel.repos import Repo
+    def _get_repo(key):
+        return Repo(key=key, path=tmp_path, display=f"mock/{key}")
+
+    monkeypatch.setattr("panel.app.get_repo", _get_repo)
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def index_html() -> str:
+    """The UI template, read once per session (path independent of the working directory)."""
+    path = Path(__file__).resolve().parent.parent / "panel" / "templates" / "index.html"
+    return path.read_text(encoding="utf-8")
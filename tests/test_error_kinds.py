@@ -1,12 +1,16 @@
-from unittest.mock import patch, MagicMock
+from pathlib import Path
+from unittest.mock import patch
 from panel.app import apply_patch_action, execute_publish, ApplyPatchReq, PublishReq
+from panel.repos import Repo
+
+MOCK_REPO = Repo(key="metarepo", path=Path("/tmp/mock"), display="heimgewebe/metarepo")
 
 def test_apply_patch_empty_error_kind():
     # Mock get_repo to avoid checking file system
     with patch("panel.app.get_repo") as mock_get_repo, \
          patch("panel.app.check_branch_guard") as mock_guard:
 
-        mock_get_repo.return_value = MagicMock(key="metarepo", path="/tmp/mock")
+        mock_get_repo.return_value = MOCK_REPO
         mock_guard.return_value = None # No error
 
         req = ApplyPatchReq(repo="metarepo", patch="   ") # Empty patch
@@ -20,7 +24,7 @@ def test_publish_invalid_branch_error_kind():
     # Test execute_publish directly
     # It requires job_id, correlation_id, repo, req
     with patch("panel.app.get_repo") as mock_get_repo:
-        mock_get_repo.return_value = MagicMock(key="metarepo", path="/tmp/mock")
+        mock_get_repo.return_value = MOCK_REPO
 
         req = PublishReq(repo="metarepo", branch="invalid\\branch")
 
@@ -1,16 +1,21 @@
+import shlex
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from unittest.mock import patch
 
 from panel.app import (
     PublishOptions,
     classify_git_ref_error,
     execute_publish,
+    git_remote_diagnose,
     git_remote_repair_stage_a,
     git_remote_repair_stage_b,
     git_remote_repair_stage_c,
 )
+from panel.repos import Repo
 from panel.runner import CmdResult
 
+MOCK_REPO = Repo(key="metarepo", path=Path("/tmp/mock"), display="heimgewebe/metarepo")
+
 
 def test_classify_git_ref_error_patterns() -> None:
     lock = "fatal: cannot lock ref 'refs/remotes/origin/HEAD': unable to resolve reference"
@@ -39,8 +44,35 @@ def test_classify_git_ref_error_patterns() -> None:
     }
 
 
+def test_diagnose_runs_all_probes_and_keeps_output_order() -> None:
+    target = MOCK_REPO
+    expected = [
+        ["git", "status", "--porcelain=v1", "-b"],
+        ["git", "remote", "-v"],
+        ["git", "show-ref", "--", "refs/remotes/origin"],
+        ["git", "symbolic-ref", "refs/remotes/origin/HEAD"],
+        ["git", "rev-parse", "--abbrev-ref", "--symbolic-full-name", "@{u}"],
+    ]
+
+    def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
+        if cmd[:2] == ["git", "symbolic-ref"]:
+            return CmdResult(code=1, stdout="", stderr="not a symbolic ref", cmd=cmd)
+        return CmdResult(code=0, stdout=" ".join(cmd[1:3]), stderr="", cmd=cmd)
+
+    with patch("panel.app.run", side_effect=run_side_effect) as mock_run, \
+         patch("panel.app.get_git_state", return_value=("feature", "abc")):
+        result = git_remote_diagnose(target, "corr-1")
+
+    assert result.ok
+    assert "Optional commands failed." in result.message
+    called = [call.args[0] for call in mock_run.call_args_list]
+    assert sorted(called) == sorted(expected)
+    positions = [result.stdout.index(f"$ {shlex.join(cmd)}") for cmd in expected]
+    assert positions == sorted(positions)
+
+
 def test_repair_stage_a_runs_prune_and_fetch() -> None:
-    target = MagicMock(key="metarepo", path=Path("/tmp/mock"))
+    target = MOCK_REPO
     with patch("panel.app.run") as mock_run:
         mock_run.side_effect = [
             CmdResult(code=0, stdout="pruned", stderr="", cmd=[]),
@@ -54,7 +86,7 @@ def test_repair_stage_a_runs_prune_and_fetch() -> None:
 
 
 def test_repair_stage_b_allows_missing_refs() -> None:
-    target = MagicMock(key="metarepo", path=Path("/tmp/mock"))
+    target = MOCK_REPO
     with patch("panel.app.run") as mock_run:
         mock_run.side_effect = [
             CmdResult(code=1, stdout="", stderr="missing", cmd=[]),
@@ -80,7 +112,7 @@ def test_repair_stage_b_allows_missing_refs() -> None:
 
 
 def test_repair_stage_b_rejects_invalid_base_branch() -> None:
-    target = MagicMock(key="metarepo", path=Path("/tmp/mock"))
+    target = MOCK_REPO
     with patch("panel.app.run") as mock_run, \
          patch("panel.app.get_git_state", return_value=("main", "abc")):
         result = git_remote_repair_stage_b(target, "corr-1", "invalid branch", True)
@@ -93,7 +125,7 @@ def test_repair_stage_b_rejects_invalid_base_branch() -> None:
 
 
 def test_repair_stage_c_runs_pack_refs_and_fetch() -> None:
-    target = MagicMock(key="metarepo", path=Path("/tmp/mock"))
+    target = MOCK_REPO
     with patch("panel.app.run") as mock_run:
         mock_run.side_effect = [
             CmdResult(code=0, stdout="packed", stderr="", cmd=[]),
@@ -109,26 +141,26 @@ def test_repair_stage_c_runs_pack_refs_and_fetch() -> None:
 def test_publish_fetch_ref_lock_sets_error_kind() -> None:
     def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
         if cmd[:3] == ["git", "ls-remote", "--heads"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
+            return CmdResult(code=0, stdout="", stderr="", cmd=cmd)
         if cmd[:2] == ["gh", "--version"]:
-            return CmdResult(code=0, stdout="gh version 2.0.0", stderr="", cmd=list(cmd))
+            return CmdResult(code=0, stdout="gh version 2.0.0", stderr="", cmd=cmd)
         if cmd[:3] == ["gh", "auth", "status"]:
-            return CmdResult(code=0, stdout="logged in", stderr="", cmd=list(cmd))
+            return CmdResult(code=0, stdout="logged in", stderr="", cmd=cmd)
         if cmd[:3] == ["git", "remote", "get-url"]:
-            return CmdResult(code=0, stdout="git@github.com:org/repo.git\n", stderr="", cmd=list(cmd))
+            return CmdResult(code=0, stdout="git@github.com:org/repo.git\n", stderr="", cmd=cmd)
         if cmd[:2] == ["git", "push"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
+            return CmdResult(code=0, stdout="", stderr="", cmd=cmd)
         if cmd[:4] == ["git", "rev-parse", "--abbrev-ref", "--symbolic-full-name"]:
-            return CmdResult(code=0, stdout="origin/feature\n", stderr="", cmd=list(cmd))
+            return CmdResult(code=0, stdout="origin/feature\n", stderr="", cmd=cmd)
         if cmd[:2] == ["git", "fetch"]:
             return CmdResult(
                 code=1,
                 stdout="",
                 stderr="fatal: cannot lock ref 'refs/remotes/origin/HEAD': "
                 "unable to resolve reference",
-                cmd=list(cmd),
+                cmd=cmd,
             )
-        return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
+        return CmdResult(code=0, stdout="", stderr="", cmd=cmd)
 
     with patch("panel.app.get_repo") as mock_get_repo, \
          patch("panel.app.is_valid_branch_name", return_value=True), \
@@ -136,7 +168,7 @@ def test_publish_fetch_ref_lock_sets_error_kind() -> None:
          patch("panel.app.git_status_porcelain", return_value=[]), \
          patch("panel.app.run", side_effect=run_side_effect), \
          patch("panel.app.record_job_result") as mock_record:
-        mock_get_repo.return_value = MagicMock(key="metarepo", path=Path("/tmp/mock"))
+        mock_get_repo.return_value = MOCK_REPO
 
         req = PublishOptions(branch="feature")
         execute_publish("job-1", "corr-1", "metarepo", req)
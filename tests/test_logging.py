@@ -64,6 +64,9 @@ def test_redact_secrets(monkeypatch):
     # Test patterns
     assert redact_secrets("ghp_12345678901234567890") == "[redacted]"
     assert redact_secrets("github_pat_12345678901234567890_123456") == "[redacted]"
+    mixed = "a ghp_SECRET12345678901234567890 b github_pat_12345678901234567890_x c"
+    assert redact_secrets(mixed) == "a [redacted] b [redacted] c"
+    assert redact_secrets("") == ""
 
     # Test query params (URL context)
     assert redact_secrets("https://api.example.com?token=abcdef123") == "https://api.example.com?token=[redacted]"
@@ -1,14 +1,32 @@
 import json
+import os
 import pytest
 from pathlib import Path
-from panel.ops import run_wgx_audit_git, run_wgx_routine_preview, run_wgx_routine_apply, create_token, AuditGit, get_latest_audit_artifact, extract_json_from_stdout
+from panel.ops import (
+    run_wgx_audit_git,
+    run_wgx_routine_preview,
+    run_wgx_routine_apply,
+    create_token,
+    validate_and_consume_token,
+    AuditGit,
+    get_latest_audit_artifact,
+    extract_json_from_stdout,
+)
 from panel.runner import CmdResult
 from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from panel.app import app
+from starlette.requests import Request
+from panel.app import (
+    app,
+    api_audit_git_sync,
+    api_routine_preview,
+    api_routine_apply,
+    RoutinePreviewReq,
+    RoutineApplyReq,
+)
 
 # Mock JSON responses matching WGX output
-MOCK_AUDIT_JSON = json.dumps({
+MOCK_AUDIT_DICT = {
     "kind": "audit.git",
     "schema_version": "v1",
     "ts": "2023-10-27T10:00:00Z",
@@ -37,9 +55,11 @@ MOCK_AUDIT_JSON = json.dumps({
     },
     "suggested_routines": [],
     "correlation_id": "test-correlation-id"
-})
+}
+MOCK_AUDIT_JSON = json.dumps(MOCK_AUDIT_DICT)
+MOCK_AUDIT_JSON_ERROR = json.dumps({**MOCK_AUDIT_DICT, "status": "error"})
 
-MOCK_PREVIEW_JSON = json.dumps({
+MOCK_PREVIEW_DICT = {
     "kind": "routine.preview",
     "id": "git.repair.remote-head",
     "mode": "dry-run",
@@ -47,9 +67,10 @@ MOCK_PREVIEW_JSON = json.dumps({
     "risk": "low",
     "steps": [{"cmd": "git remote set-head origin --auto", "why": "Restore origin/HEAD"}],
     "expected_effect": "origin/HEAD restored"
-})
+}
+MOCK_PREVIEW_JSON = json.dumps(MOCK_PREVIEW_DICT)
 
-MOCK_RESULT_JSON = json.dumps({
+MOCK_RESULT_DICT = {
     "kind": "routine.result",
     "id": "git.repair.remote-head",
     "mode": "apply",
@@ -57,7 +78,25 @@ MOCK_RESULT_JSON = json.dumps({
     "ok": True,
     "state_hash": {"before": "aaa", "after": "bbb"},
     "stdout": "Fixed."
-})
+}
+MOCK_RESULT_JSON = json.dumps(MOCK_RESULT_DICT)
+
+# Static runner results; panel.ops never reads or mutates CmdResult.cmd
+CMD_AUDIT_OK = CmdResult(0, MOCK_AUDIT_JSON, "", [])
+CMD_AUDIT_ERROR = CmdResult(1, MOCK_AUDIT_JSON_ERROR, "some stderr", [])
+CMD_PREVIEW_OK = CmdResult(0, MOCK_PREVIEW_JSON, "", [])
+CMD_RESULT_OK = CmdResult(0, MOCK_RESULT_JSON, "", [])
+CMD_RESULT_NONZERO = CmdResult(1, MOCK_RESULT_JSON, "some stderr", [])
+
+ROUTINE_ID = "git.repair.remote-head"
+DUMMY_HASH = "0" * 64
+
+# (routine_id, verb) -> runner result for mocked `wgx routine` calls
+ROUTINE_DISPATCH = {
+    (ROUTINE_ID, "preview"): CMD_PREVIEW_OK,
+    (ROUTINE_ID, "apply"): CMD_RESULT_OK,
+    ("fail.test", "apply"): CMD_RESULT_NONZERO,
+}
 
 def _mk_repo(tmp_path: Path, name: str = "repo") -> Path:
     p = tmp_path / name
@@ -82,7 +121,7 @@ def mock_run_wgx(monkeypatch):
 
              if repo == "mock_repo":
                  if "--stdout-json" in cmd:
-                     return CmdResult(0, MOCK_AUDIT_JSON, "", cmd)
+                     return CMD_AUDIT_OK
                  else:
                      # File mode (default)
                      # Determine correlation ID
@@ -103,43 +142,55 @@ def mock_run_wgx(monkeypatch):
                      # Return path relative to repo (cwd)
                      return CmdResult(0, str(Path(".wgx") / "out" / filename), "", cmd)
              elif repo == "fail_repo":
-                 return CmdResult(1, MOCK_AUDIT_JSON.replace('"status": "ok"', '"status": "error"'), "some stderr", cmd)
+                 return CMD_AUDIT_ERROR
              elif repo == "metarepo": # For API tests using metarepo
-                 return CmdResult(0, MOCK_AUDIT_JSON, "", cmd)
+                 return CMD_AUDIT_OK
 
-        # Check for routine preview
-        if "routine" in cmd and "preview" in cmd:
-            if "git.repair.remote-head" in cmd:
-                return CmdResult(0, MOCK_PREVIEW_JSON, "", cmd)
-
-        # Check for routine apply
-        if "routine" in cmd and "apply" in cmd:
-            if "git.repair.remote-head" in cmd:
-                return CmdResult(0, MOCK_RESULT_JSON, "", cmd)
-            if "fail.test" in cmd:
-                 return CmdResult(1, MOCK_RESULT_JSON, "some stderr", cmd)
+        # Routine commands: ["wgx", "routine", <id>, <verb>, ...]
+        if cmd[:2] == ["wgx", "routine"]:
+            result = ROUTINE_DISPATCH.get(tuple(cmd[2:4]))
+            if result is not None:
+                return result
 
         return CmdResult(1, "", f"Unknown command: {cmd}", cmd)
 
     monkeypatch.setattr("panel.ops.run", _run)
 
-def test_run_wgx_audit_git(mock_run_wgx, tmp_path):
-    # Tests file mode (default behavior)
-    repo_path = _mk_repo(tmp_path, "repo")
-    result = run_wgx_audit_git("mock_repo", repo_path, "corr-1") # Defaults to stdout_json=False
+@pytest.fixture
+def mock_run_table(monkeypatch):
+    """Installs a panel.ops.run mock answering from (predicate, CmdResult) rules.
+
+    The first matching rule wins.
+    """
+    def _install(*rules, default=CmdResult(1, "", "Unknown command", [])):
+        def _run(cmd, cwd, timeout=60, **kwargs):
+            for predicate, result in rules:
+                if predicate(cmd):
+                    return result
+            return default
+
+        monkeypatch.setattr("panel.ops.run", _run)
+
+    return _install
+
+@pytest.mark.parametrize(
+    "repo_key,stdout_json,expected_status",
+    [
+        ("mock_repo", False, "ok"),
+        ("mock_repo", True, "ok"),
+        ("fail_repo", True, "error"),
+    ],
+    ids=["file-mode", "stdout-json", "stdout-json-nonzero-exit"],
+)
+def test_run_wgx_audit_git(mock_run_wgx, tmp_path, repo_key, stdout_json, expected_status):
+    repo_path = _mk_repo(tmp_path, repo_key)
+    result = run_wgx_audit_git(repo_key, repo_path, "corr-1", stdout_json=stdout_json)
 
     assert isinstance(result, AuditGit)
     assert result.repo == "mock_repo"
-    assert result.status == "ok"
+    assert result.status == expected_status
     assert result.correlation_id == "corr-1"
 
-def test_run_wgx_audit_git_nonzero_exit_with_json(mock_run_wgx, tmp_path):
-    repo_path = _mk_repo(tmp_path, "fail_repo")
-    result = run_wgx_audit_git("fail_repo", repo_path, "corr-2", stdout_json=True)
-
-    assert isinstance(result, AuditGit)
-    assert result.status == "error"
-
 def test_run_wgx_audit_git_stdout_flag(monkeypatch, tmp_path):
     repo_path = _mk_repo(tmp_path, "mock_repo")
     called_with_flag = False
@@ -156,25 +207,6 @@ def test_run_wgx_audit_git_stdout_flag(monkeypatch, tmp_path):
     assert called_with_flag
     assert result.status == "ok"
 
-def test_token_mismatch_deletes_token(mock_run_wgx, tmp_path):
-    """Test that token validation mismatch deletes the token to prevent brute-forcing."""
-    repo_path = _mk_repo(tmp_path, "mock_repo")
-    repo_key = "mock_repo"
-    routine_id = "git.repair.remote-head"
-
-    # Generate token
-    _, token, p_hash = run_wgx_routine_preview(repo_key, repo_path, routine_id)
-
-    # Try to use token with wrong repo
-    with pytest.raises(HTTPException) as excinfo:
-        run_wgx_routine_apply("wrong_repo", repo_path, routine_id, token, p_hash)
-    assert excinfo.value.status_code == 403
-
-    # Try again with CORRECT repo - should fail because token was deleted
-    with pytest.raises(HTTPException) as excinfo:
-        run_wgx_routine_apply(repo_key, repo_path, routine_id, token, p_hash)
-    assert excinfo.value.status_code == 403
-
 def test_run_wgx_routine_flow(mock_run_wgx, tmp_path):
     repo_path = _mk_repo(tmp_path, "mock_repo")
     repo_key = "mock_repo"
@@ -191,77 +223,117 @@ def test_run_wgx_routine_flow(mock_run_wgx, tmp_path):
     assert result["kind"] == "routine.result"
     assert result["ok"] is True
 
-def test_run_wgx_routine_apply_invalid_token(mock_run_wgx, tmp_path):
-    repo_path = _mk_repo(tmp_path, "mock_repo")
-    repo_key = "mock_repo"
-    routine_id = "git.repair.remote-head"
-    dummy_hash = "0" * 64
+def _invalid_token() -> str:
+    return "invalid-token"
 
-    with pytest.raises(HTTPException) as excinfo:
-        run_wgx_routine_apply(repo_key, repo_path, routine_id, "invalid-token", dummy_hash)
+def _fresh_token() -> str:
+    return create_token(
+        {"repo_key": "mock_repo", "routine_id": ROUTINE_ID, "preview_hash": DUMMY_HASH}
+    )
 
+def _reused_token() -> str:
+    token = _fresh_token()
+    assert validate_and_consume_token(token, "mock_repo", ROUTINE_ID, DUMMY_HASH)
+    return token
+
+@pytest.mark.parametrize(
+    "repo_key,routine_id,token_factory",
+    [
+        ("mock_repo", ROUTINE_ID, _invalid_token),
+        ("wrong_repo", ROUTINE_ID, _fresh_token),
+        ("mock_repo", "wrong.routine", _fresh_token),
+        ("mock_repo", ROUTINE_ID, _reused_token),
+    ],
+    ids=["invalid", "wrong-repo", "wrong-routine", "reused"],
+)
+def test_run_wgx_routine_apply_rejects_token(
+    mock_run_wgx, tmp_path, repo_key, routine_id, token_factory
+):
+    """Rejected tokens yield 403 and are gone afterwards.
+
+    A mismatch deletes the token to prevent brute-forcing.
+    """
+    token = token_factory()
+
+    with pytest.raises(HTTPException) as excinfo:
+        run_wgx_routine_apply(repo_key, tmp_path, routine_id, token, DUMMY_HASH)
     assert excinfo.value.status_code == 403
 
-def test_run_wgx_routine_apply_token_reuse_fails(mock_run_wgx, tmp_path):
-    repo_path = _mk_repo(tmp_path, "mock_repo")
-    repo_key = "mock_repo"
-    routine_id = "git.repair.remote-head"
+    # A retry with the correct repo/routine must fail as well
+    assert not validate_and_consume_token(token, "mock_repo", ROUTINE_ID, DUMMY_HASH)
 
-    preview, token, p_hash = run_wgx_routine_preview(repo_key, repo_path, routine_id)
+def test_create_token_is_unique_per_call():
+    """Tokens are single-use nonces; identical payloads must never share a token."""
+    payload = {"repo_key": "mock_repo", "routine_id": ROUTINE_ID, "preview_hash": DUMMY_HASH}
+    first = create_token(payload)
+    second = create_token(payload)
+    assert first != second
 
-    # Use once -> OK
-    run_wgx_routine_apply(repo_key, repo_path, routine_id, token, p_hash)
+    # Consuming one leaves the other usable
+    assert validate_and_consume_token(first, "mock_repo", ROUTINE_ID, DUMMY_HASH)
+    assert validate_and_consume_token(second, "mock_repo", ROUTINE_ID, DUMMY_HASH)
 
-    # Use again -> Fail
-    with pytest.raises(HTTPException) as excinfo:
-        run_wgx_routine_apply(repo_key, repo_path, routine_id, token, p_hash)
+def test_token_store_is_bounded(monkeypatch):
+    """The oldest tokens are evicted once the store is full; raw tokens are never stored."""
+    from panel.ops import TOKEN_STORE, _token_key
+    monkeypatch.setattr("panel.ops.TOKEN_MAX_ENTRIES", 3)
+    payload = {"repo_key": "mock_repo", "routine_id": ROUTINE_ID, "preview_hash": DUMMY_HASH}
+    tokens = [create_token(payload) for _ in range(4)]
 
-    assert excinfo.value.status_code == 403
+    assert list(TOKEN_STORE) == [_token_key(t) for t in tokens[1:]]
+    assert not validate_and_consume_token(tokens[0], "mock_repo", ROUTINE_ID, DUMMY_HASH)
+    assert validate_and_consume_token(tokens[-1], "mock_repo", ROUTINE_ID, DUMMY_HASH)
+
+@pytest.fixture
+def routine_token(request):
+    """Fresh (token, preview_hash) for mock_repo and the routine id given via indirect param.
+
+    Not memoized: tokens are single-use and the token store is reset per test.
+    """
+    preview_hash = "abc"
+    token = create_token(
+        {"repo_key": "mock_repo", "routine_id": request.param, "preview_hash": preview_hash}
+    )
+    return token, preview_hash
 
-def test_run_wgx_routine_apply_handles_nonzero_exit_with_json(monkeypatch, tmp_path):
+@pytest.mark.parametrize("routine_token", ["fail.test"], indirect=True)
+def test_run_wgx_routine_apply_handles_nonzero_exit_with_json(
+    mock_run_table, tmp_path, routine_token
+):
     """
     Test that a non-zero exit code is tolerated if valid JSON with 'ok' field is returned.
     """
     repo_path = _mk_repo(tmp_path, "mock_repo")
-    repo_key = "mock_repo"
-    routine_id = "fail.test"
-
-    # Manually create valid token for test
-    token = create_token({"repo_key": repo_key, "routine_id": routine_id, "preview_hash": "abc"})
+    token, p_hash = routine_token
 
     # Local mock runner that forces nonzero exit but valid JSON
-    def _run_nonzero(cmd, cwd, timeout=60, **kwargs):
-        if "fail.test" in cmd:
-            return CmdResult(1, MOCK_RESULT_JSON, "", cmd)
-        return CmdResult(0, MOCK_RESULT_JSON, "", cmd)
-
-    monkeypatch.setattr("panel.ops.run", _run_nonzero)
+    mock_run_table(
+        (lambda cmd: "fail.test" in cmd, CmdResult(1, MOCK_RESULT_JSON, "", [])),
+        default=CMD_RESULT_OK,
+    )
 
-    result = run_wgx_routine_apply(repo_key, repo_path, routine_id, token, "abc")
+    result = run_wgx_routine_apply("mock_repo", repo_path, "fail.test", token, p_hash)
     assert result["kind"] == "routine.result"
     assert result["ok"] is True
     assert result.get("_exit_code") == 1
 
-def test_run_wgx_routine_apply_nonzero_exit_without_ok(monkeypatch, mock_run_wgx, tmp_path):
+@pytest.mark.parametrize("routine_token", ["crash.test"], indirect=True)
+def test_run_wgx_routine_apply_nonzero_exit_without_ok(mock_run_table, tmp_path, routine_token):
     """
     Test that non-zero exit code raises Error if JSON lacks 'ok' field.
     """
     repo_path = _mk_repo(tmp_path, "mock_repo")
-    repo_key = "mock_repo"
-    routine_id = "crash.test"
+    token, p_hash = routine_token
 
     bad_json = json.dumps({"kind": "error", "message": "Crash"}) # No 'ok'
 
-    def _run(cmd, cwd, timeout=60, **kwargs):
-        if "crash.test" in cmd:
-            return CmdResult(1, bad_json, "stderr logs", cmd)
-        return CmdResult(0, "{}", "", cmd)
-
-    monkeypatch.setattr("panel.ops.run", _run)
-    token = create_token({"repo_key": repo_key, "routine_id": routine_id, "preview_hash": "abc"})
+    mock_run_table(
+        (lambda cmd: "crash.test" in cmd, CmdResult(1, bad_json, "stderr logs", [])),
+        default=CmdResult(0, "{}", "", []),
+    )
 
     with pytest.raises(RuntimeError) as excinfo:
-        run_wgx_routine_apply(repo_key, repo_path, routine_id, token, "abc")
+        run_wgx_routine_apply("mock_repo", repo_path, "crash.test", token, p_hash)
 
     assert "lacks 'ok' field" in str(excinfo.value)
 
@@ -274,21 +346,99 @@ def test_get_latest_audit_artifact(tmp_path):
     old = out_dir / "audit.git.v1.old.json"
     old.write_text(MOCK_AUDIT_JSON, encoding="utf-8")
     # Force older mtime
-    import os
-    os.utime(old, (100, 100))
+    os.utime(old, ns=(0, 0))
 
     # New file
     new = out_dir / "audit.git.v1.new.json"
-    # Robustly modify JSON instead of string replace
-    data = json.loads(MOCK_AUDIT_JSON)
-    data["status"] = "warn"
-    new.write_text(json.dumps(data), encoding="utf-8")
+    new.write_text(json.dumps({**MOCK_AUDIT_DICT, "status": "warn"}), encoding="utf-8")
 
     result = get_latest_audit_artifact(tmp_path)
     assert result is not None
     assert result.status == "warn" # Should pick the new one
 
-def test_run_wgx_audit_git_file_mode(tmp_path, monkeypatch):
+def test_get_latest_audit_artifact_cache_invalidation(tmp_path):
+    out_dir = tmp_path / ".wgx" / "out"
+    out_dir.mkdir(parents=True)
+    first = out_dir / "audit.git.v1.first.json"
+    first.write_text(MOCK_AUDIT_JSON, encoding="utf-8")
+    os.utime(first, ns=(0, 0))
+    # Backdate the directory so it is old enough to be cached
+    os.utime(out_dir, ns=(0, 0))
+
+    cached = get_latest_audit_artifact(tmp_path)
+    assert cached.status == "ok"
+    # Unchanged directory -> same cached object
+    assert get_latest_audit_artifact(tmp_path) is cached
+
+    # New artifact -> directory mtime changes -> rescan
+    second = out_dir / "audit.git.v1.second.json"
+    second.write_text(json.dumps({**MOCK_AUDIT_DICT, "status": "warn"}), encoding="utf-8")
+    assert get_latest_audit_artifact(tmp_path).status == "warn"
+    os.utime(second, ns=(1, 1))
+    os.utime(out_dir, ns=(1, 1))
+    assert get_latest_audit_artifact(tmp_path) is get_latest_audit_artifact(tmp_path)
+
+    # In-place rewrite of the chosen artifact -> file mtime changes -> rescan
+    second.write_text(json.dumps({**MOCK_AUDIT_DICT, "status": "error"}), encoding="utf-8")
+    os.utime(second, ns=(10**18, 10**18))
+    assert get_latest_audit_artifact(tmp_path).status == "error"
+
+def test_get_latest_audit_artifact_recently_written_file_is_not_cached(tmp_path):
+    out_dir = tmp_path / ".wgx" / "out"
+    out_dir.mkdir(parents=True)
+    artifact = out_dir / "audit.git.v1.a.json"
+    artifact.write_text(MOCK_AUDIT_JSON, encoding="utf-8")
+    os.utime(out_dir, ns=(0, 0))
+
+    assert get_latest_audit_artifact(tmp_path).status == "ok"
+    # Rewritten within the same timestamp tick: neither mtime moves
+    mtime_ns = artifact.stat().st_mtime_ns
+    artifact.write_text(json.dumps({**MOCK_AUDIT_DICT, "status": "warn"}), encoding="utf-8")
+    os.utime(artifact, ns=(mtime_ns, mtime_ns))
+    assert get_latest_audit_artifact(tmp_path).status == "warn"
+
+def test_get_latest_audit_artifact_does_not_cache_past_unreadable_candidate(tmp_path):
+    out_dir = tmp_path / ".wgx" / "out"
+    out_dir.mkdir(parents=True)
+    older = out_dir / "audit.git.v1.older.json"
+    older.write_text(MOCK_AUDIT_JSON, encoding="utf-8")
+    partial = out_dir / "audit.git.v1.newer.json"
+    partial.write_text(MOCK_AUDIT_JSON[:10], encoding="utf-8")
+    os.utime(older, ns=(1, 1))
+    os.utime(partial, ns=(2, 2))
+    os.utime(out_dir, ns=(0, 0))
+
+    assert get_latest_audit_artifact(tmp_path).status == "ok"
+    # The newer artifact is finished in place; directory mtime stays put
+    partial.write_text(json.dumps({**MOCK_AUDIT_DICT, "status": "warn"}), encoding="utf-8")
+    os.utime(partial, ns=(2, 2))
+    os.utime(out_dir, ns=(0, 0))
+    assert get_latest_audit_artifact(tmp_path).status == "warn"
+
+def test_get_latest_audit_artifact_reuses_parsed_files(tmp_path, monkeypatch):
+    """Unchanged artifacts are not re-validated, even when the directory itself changed."""
+    import panel.ops
+    calls = []
+    real_parse = panel.ops._parse_audit
+
+    def _spy(raw):
+        calls.append(raw)
+        return real_parse(raw)
+
+    monkeypatch.setattr("panel.ops._parse_audit", _spy)
+    out_dir = tmp_path / ".wgx" / "out"
+    out_dir.mkdir(parents=True)
+    (out_dir / "audit.git.v1.a.json").write_text(MOCK_AUDIT_JSON, encoding="utf-8")
+
+    assert get_latest_audit_artifact(tmp_path, repo_key="mock_repo").status == "ok"
+    # Artifact for another repo -> directory rescan, but the mock_repo file is not re-parsed
+    (out_dir / "audit.git.v1.b.json").write_text(
+        json.dumps({**MOCK_AUDIT_DICT, "repo": "other"}), encoding="utf-8"
+    )
+    assert get_latest_audit_artifact(tmp_path, repo_key="mock_repo").status == "ok"
+    assert len(calls) == 2  # a.json once, b.json once
+
+def test_run_wgx_audit_git_file_mode(tmp_path, mock_run_table):
     """Test that file artifact mode works by reading the file returned in stdout."""
     repo_path = _mk_repo(tmp_path, "repo")
 
@@ -301,28 +451,23 @@ def test_run_wgx_audit_git_file_mode(tmp_path, monkeypatch):
     # Mock run to return the path relative to repo
     # Note: the real code now resolves this path absolutely.
     # If the mock returns a relative path, extract_path_from_stdout will resolve it against repo_path.
-    def _run(cmd, cwd, timeout=60, **kwargs):
-        # Must return the path relative to cwd (repo_path)
-        return CmdResult(0, ".wgx/out/audit.git.v1.test.json", "", cmd)
-
-    monkeypatch.setattr("panel.ops.run", _run)
+    # Must return the path relative to cwd (repo_path)
+    mock_run_table(default=CmdResult(0, ".wgx/out/audit.git.v1.test.json", "", []))
 
     result = run_wgx_audit_git("mock_repo", repo_path, "corr-test", stdout_json=False)
     assert isinstance(result, AuditGit)
     assert result.status == "ok"
 
-def test_run_wgx_audit_git_stdout_noise_info(monkeypatch, tmp_path):
+def test_run_wgx_audit_git_stdout_noise_info(mock_run_table, tmp_path):
     """Test robust JSON extraction when stdout contains [INFO] tags which are brackets."""
     repo_path = _mk_repo(tmp_path, "mock_repo")
 
     noisy_output = f"[INFO] Starting audit\n{MOCK_AUDIT_JSON}\n[DEBUG] Cleanup done"
 
-    def _run(cmd, cwd, timeout=60, **kwargs):
-        if "--stdout-json" in cmd:
-             return CmdResult(0, noisy_output, "", cmd)
-        return CmdResult(1, "", "fail", cmd)
-
-    monkeypatch.setattr("panel.ops.run", _run)
+    mock_run_table(
+        (lambda cmd: "--stdout-json" in cmd, CmdResult(0, noisy_output, "", [])),
+        default=CmdResult(1, "", "fail", []),
+    )
 
     result = run_wgx_audit_git("mock_repo", repo_path, "corr-test", stdout_json=True)
     assert isinstance(result, AuditGit)
@@ -338,7 +483,22 @@ def test_extract_json_from_stdout_nested_brackets():
     assert result["key"] == "value with { braces }"
     assert result["list"] == [1, 2, 3]
 
-def test_run_wgx_routine_stdout_fallback_file_path(tmp_path, monkeypatch):
+@pytest.mark.parametrize(
+    "stdout,expected",
+    [
+        ('warn: {not json} then {"a": {"b": 1}} }}', {"a": {"b": 1}}),
+        ("progress [##] done [1, 2]", [1, 2]),
+        ("[1, 2] before {\"x\": 1}", {"x": 1}),  # objects are preferred over arrays
+    ],
+)
+def test_extract_json_from_stdout_skips_invalid_candidates(stdout, expected):
+    assert extract_json_from_stdout(stdout) == expected
+
+@pytest.mark.parametrize("stdout", ["42", '"audit"', ".wgx/out/audit.git.v1.json", "true"])
+def test_extract_json_from_stdout_ignores_scalars_and_paths(stdout):
+    assert extract_json_from_stdout(stdout) is None
+
+def test_run_wgx_routine_stdout_fallback_file_path(tmp_path, mock_run_table):
     """
     Test that if wgx routine outputs a file path instead of JSON (because no --stdout-json flag),
     the code correctly reads that file.
@@ -354,30 +514,31 @@ def test_run_wgx_routine_stdout_fallback_file_path(tmp_path, monkeypatch):
     artifact_path.write_text(MOCK_PREVIEW_JSON, encoding="utf-8")
 
     # Mock run to return path (relative)
-    def _run(cmd, cwd, timeout=60, **kwargs):
-        return CmdResult(0, ".wgx/out/routine.preview.json", "", cmd)
-
-    monkeypatch.setattr("panel.ops.run", _run)
+    mock_run_table(default=CmdResult(0, ".wgx/out/routine.preview.json", "", []))
 
     preview, token, p_hash = run_wgx_routine_preview(repo_key, repo_path, routine_id)
     assert preview["kind"] == "routine.preview"
 
 # API & Sync Fallback Tests
 
-@pytest.fixture
-def mock_get_repo(monkeypatch, tmp_path):
-    """Patches get_repo to always return a Repo pointing to tmp_path for CI stability."""
-    from panel.repos import Repo
-    def _get_repo(key):
-        return Repo(key=key, path=tmp_path, display=f"mock/{key}")
+def _request(headers: dict[str, str] | None = None) -> Request:
+    """Minimal HTTP request for calling endpoint functions directly (no ASGI round trip)."""
+    raw = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in (headers or {}).items()]
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "path": "/",
+        "root_path": "",
+        "query_string": b"",
+        "headers": raw,
+    })
 
-    monkeypatch.setattr("panel.app.get_repo", _get_repo)
-    return tmp_path
+ACTOR_HEADERS = {"X-ACS-Actor-Token": "testsecret"}
 
 def test_api_audit_git_sync_fallback(monkeypatch, mock_get_repo):
     """Test that sync audit endpoint falls back to file mode if stdout fails."""
-    client = TestClient(app)
-
     # Setup artifact file for fallback
     out_dir = mock_get_repo / ".wgx" / "out"
     out_dir.mkdir(parents=True)
@@ -400,43 +561,56 @@ def test_api_audit_git_sync_fallback(monkeypatch, mock_get_repo):
 
     monkeypatch.setattr("panel.ops.run", _run)
 
-    response = client.get("/api/audit/git/sync?repo=metarepo")
+    response = api_audit_git_sync(repo="metarepo")
     assert response.status_code == 200
-    assert response.json()["status"] == "ok"
+    assert json.loads(response.body)["status"] == "ok"
     assert call_count == 2 # Should have tried twice
 
 def test_routines_safety_gate(monkeypatch, mock_get_repo):
     """Test that routine endpoints are disabled by default."""
-    client = TestClient(app)
-
     # Default: disabled -> 403
     monkeypatch.delenv("ACS_ENABLE_ROUTINES", raising=False)
 
-    res = client.post("/api/routine/preview", json={"repo": "metarepo", "id": "test"})
-    assert res.status_code == 403, res.text
-    assert "disabled" in res.json()["detail"]
+    with pytest.raises(HTTPException) as excinfo:
+        api_routine_preview(RoutinePreviewReq(repo="metarepo", id="test"), _request())
+    assert excinfo.value.status_code == 403
+    assert "disabled" in excinfo.value.detail
+
+    with pytest.raises(HTTPException) as excinfo:
+        api_routine_apply(
+            RoutineApplyReq(repo="metarepo", id="test", confirm_token="x", preview_hash="dummy"),
+            _request(),
+        )
+    assert excinfo.value.status_code == 403
+
+def test_resolve_routines_config_caching(monkeypatch):
+    from panel.app import resolve_routines_config
+    monkeypatch.setenv("ACS_ENABLE_ROUTINES", "yes")
+    monkeypatch.setenv("ACS_ROUTINES_SHARED_SECRET", " s3cret ")
+    config = resolve_routines_config()
+    assert config.enabled is True
+    assert config.shared_secret == "s3cret"
 
-    # Payload must be valid to reach 403
-    res = client.post("/api/routine/apply", json={"repo": "metarepo", "id": "test", "confirm_token": "x", "preview_hash": "dummy"})
-    assert res.status_code == 403, res.text
+    # Cached until cache_clear(): env changes are not picked up per request
+    monkeypatch.setenv("ACS_ENABLE_ROUTINES", "false")
+    assert resolve_routines_config() is config
+    resolve_routines_config.cache_clear()
+    assert resolve_routines_config().enabled is False
 
 def test_routines_fails_if_secret_missing(monkeypatch, mock_get_repo):
     """Test that routines fail with 403 if ACS_ROUTINES_SHARED_SECRET is not set."""
-    client = TestClient(app)
     monkeypatch.setenv("ACS_ENABLE_ROUTINES", "true")
     monkeypatch.delenv("ACS_ROUTINES_SHARED_SECRET", raising=False)
 
-    res = client.post("/api/routine/preview", json={"repo": "metarepo", "id": "test"})
-    assert res.status_code == 403
-    assert "ACS_ROUTINES_SHARED_SECRET" in res.json()["detail"]
+    with pytest.raises(HTTPException) as excinfo:
+        api_routine_preview(RoutinePreviewReq(repo="metarepo", id="test"), _request())
+    assert excinfo.value.status_code == 403
+    assert "ACS_ROUTINES_SHARED_SECRET" in excinfo.value.detail
 
-def test_routines_safety_gate_enabled_with_mock_run(monkeypatch, mock_run_wgx, mock_get_repo):
+def test_routines_safety_gate_enabled_with_mock_run(
+    mock_run_wgx, mock_get_repo, routines_enabled, client
+):
     """Test that routine endpoints work when enabled and authenticated."""
-    client = TestClient(app)
-
-    monkeypatch.setenv("ACS_ENABLE_ROUTINES", "true")
-    monkeypatch.setenv("ACS_ROUTINES_SHARED_SECRET", "testsecret")
-
     # Preview
     res = client.post(
         "/api/routine/preview",
@@ -460,7 +634,7 @@ def test_routines_safety_gate_enabled_with_mock_run(monkeypatch, mock_run_wgx, m
     )
     assert res.status_code == 200
 
-def test_api_routine_apply_fails_conflict(monkeypatch, mock_get_repo):
+def test_api_routine_apply_fails_conflict(mock_run_table, mock_get_repo, routines_enabled):
     """Test that api_routine_apply returns 409 if the routine reports ok=False."""
     # Mock result with ok=False
     mock_fail_json = json.dumps({
@@ -472,48 +646,34 @@ def test_api_routine_apply_fails_conflict(monkeypatch, mock_get_repo):
         "stdout": "Oops."
     })
 
-    def _run(cmd, cwd, timeout=60, **kwargs):
-        if "fail.test" in cmd:
-            if "preview" in cmd:
-                 return CmdResult(0, MOCK_PREVIEW_JSON, "", cmd)
-            return CmdResult(0, mock_fail_json, "", cmd)
-        return CmdResult(0, MOCK_RESULT_JSON, "", cmd)
-
-    monkeypatch.setattr("panel.ops.run", _run)
-
-    client = TestClient(app)
-    monkeypatch.setenv("ACS_ENABLE_ROUTINES", "true")
-    monkeypatch.setenv("ACS_ROUTINES_SHARED_SECRET", "testsecret")
+    mock_run_table(
+        (lambda cmd: "fail.test" in cmd and "preview" in cmd, CMD_PREVIEW_OK),
+        (lambda cmd: "fail.test" in cmd, CmdResult(0, mock_fail_json, "", [])),
+        default=CMD_RESULT_OK,
+    )
 
     # 1. Preview
-    res = client.post(
-        "/api/routine/preview",
-        json={"repo": "metarepo", "id": "fail.test"},
-        headers={"X-ACS-Actor-Token": "testsecret"}
+    res = api_routine_preview(
+        RoutinePreviewReq(repo="metarepo", id="fail.test"), _request(ACTOR_HEADERS)
     )
     assert res.status_code == 200
-    data = res.json()
+    data = json.loads(res.body)
 
     # 2. Apply and expect conflict
-    res = client.post(
-        "/api/routine/apply",
-        json={
-            "repo": "metarepo",
-            "id": "fail.test",
-            "confirm_token": data["confirm_token"],
-            "preview_hash": data["preview_hash"]
-        },
-        headers={"X-ACS-Actor-Token": "testsecret"}
+    res = api_routine_apply(
+        RoutineApplyReq(
+            repo="metarepo",
+            id="fail.test",
+            confirm_token=data["confirm_token"],
+            preview_hash=data["preview_hash"],
+        ),
+        _request(ACTOR_HEADERS),
     )
     assert res.status_code == 409
-    assert res.json()["ok"] is False
+    assert json.loads(res.body)["ok"] is False
 
-def test_api_routine_apply_fails_missing_ok_field(monkeypatch, mock_run_wgx, mock_get_repo):
+def test_api_routine_apply_fails_missing_ok_field(mock_run_table, mock_get_repo, routines_enabled):
     """Test that api_routine_apply returns 500 if the routine output lacks 'ok' field."""
-    client = TestClient(app)
-    monkeypatch.setenv("ACS_ENABLE_ROUTINES", "true")
-    monkeypatch.setenv("ACS_ROUTINES_SHARED_SECRET", "testsecret")
-
     # Mock result without 'ok' field (invalid result structure)
     mock_invalid_json = json.dumps({
         "kind": "routine.result",
@@ -524,58 +684,55 @@ def test_api_routine_apply_fails_missing_ok_field(monkeypatch, mock_run_wgx, moc
         "stdout": "Weird result."
     })
 
-    def _run(cmd, cwd, timeout=60, **kwargs):
-        if "invalid.test" in cmd:
-            if "preview" in cmd:
-                 return CmdResult(0, MOCK_PREVIEW_JSON, "", cmd)
-            # Exit code 0 so ops layer passes it through, but content is invalid for API
-            return CmdResult(0, mock_invalid_json, "", cmd)
-        return CmdResult(0, MOCK_RESULT_JSON, "", cmd)
-
-    monkeypatch.setattr("panel.ops.run", _run)
+    # Exit code 0 so ops layer passes it through, but content is invalid for API
+    mock_run_table(
+        (lambda cmd: "invalid.test" in cmd and "preview" in cmd, CMD_PREVIEW_OK),
+        (lambda cmd: "invalid.test" in cmd, CmdResult(0, mock_invalid_json, "", [])),
+        default=CMD_RESULT_OK,
+    )
 
     # 1. Preview
-    res = client.post(
-        "/api/routine/preview",
-        json={"repo": "metarepo", "id": "invalid.test"},
-        headers={"X-ACS-Actor-Token": "testsecret"}
+    res = api_routine_preview(
+        RoutinePreviewReq(repo="metarepo", id="invalid.test"), _request(ACTOR_HEADERS)
     )
     assert res.status_code == 200
-    data = res.json()
+    data = json.loads(res.body)
 
     # 2. Apply
-    res = client.post(
-        "/api/routine/apply",
-        json={
-            "repo": "metarepo",
-            "id": "invalid.test",
-            "confirm_token": data["confirm_token"],
-            "preview_hash": data["preview_hash"]
-        },
-        headers={"X-ACS-Actor-Token": "testsecret"}
-    )
-    assert res.status_code == 500
-    assert "missing 'ok' field" in res.json()["detail"]
+    with pytest.raises(HTTPException) as excinfo:
+        api_routine_apply(
+            RoutineApplyReq(
+                repo="metarepo",
+                id="invalid.test",
+                confirm_token=data["confirm_token"],
+                preview_hash=data["preview_hash"],
+            ),
+            _request(ACTOR_HEADERS),
+        )
+    assert excinfo.value.status_code == 500
+    assert "missing 'ok' field" in excinfo.value.detail
 
 def test_routines_safety_gate_secret(monkeypatch, mock_run_wgx, mock_get_repo):
     """Test that X-ACS-Actor-Token or CSRF is required if secret is set."""
-    client = TestClient(app)
     monkeypatch.setenv("ACS_ENABLE_ROUTINES", "true")
     monkeypatch.setenv("ACS_ROUTINES_SHARED_SECRET", "supersecret")
+    req = RoutinePreviewReq(repo="metarepo", id=ROUTINE_ID)
 
     # 1. Missing both -> 403
-    res = client.post("/api/routine/preview", json={"repo": "metarepo", "id": "git.repair.remote-head"})
-    assert res.status_code == 403
-    assert "authentication" in res.json()["detail"]
+    with pytest.raises(HTTPException) as excinfo:
+        api_routine_preview(req, _request())
+    assert excinfo.value.status_code == 403
+    assert "authentication" in excinfo.value.detail
 
     # 2. Wrong Actor-Token -> 403
-    res = client.post("/api/routine/preview", json={"repo": "metarepo", "id": "git.repair.remote-head"}, headers={"X-ACS-Actor-Token": "wrong"})
-    assert res.status_code == 403
+    with pytest.raises(HTTPException) as excinfo:
+        api_routine_preview(req, _request({"X-ACS-Actor-Token": "wrong"}))
+    assert excinfo.value.status_code == 403
 
     # 3. Correct Actor-Token -> 200
-    res = client.post("/api/routine/preview", json={"repo": "metarepo", "id": "git.repair.remote-head"}, headers={"X-ACS-Actor-Token": "supersecret"})
+    res = api_routine_preview(req, _request({"X-ACS-Actor-Token": "supersecret"}))
     assert res.status_code == 200
-    assert "confirm_token" in res.json()
+    assert "confirm_token" in json.loads(res.body)
 
 def test_routines_ui_auth_path(monkeypatch, mock_run_wgx, mock_get_repo):
     """Test the UI auth path using CSRF cookie/header and Origin check."""
@@ -617,12 +774,8 @@ def test_routines_ui_auth_path(monkeypatch, mock_run_wgx, mock_get_repo):
     )
     assert res.status_code == 200
 
-def test_api_routine_validation_invalid_id(monkeypatch, mock_get_repo):
+def test_api_routine_validation_invalid_id(mock_get_repo, routines_enabled, client):
     """Test that invalid routine IDs are rejected."""
-    client = TestClient(app)
-    monkeypatch.setenv("ACS_ENABLE_ROUTINES", "true")
-    monkeypatch.setenv("ACS_ROUTINES_SHARED_SECRET", "testsecret")
-
     # Invalid ID (spaces) -> 422
     res = client.post(
         "/api/routine/preview",
@@ -639,7 +792,15 @@ def test_api_routine_validation_invalid_id(monkeypatch, mock_get_repo):
     )
     assert res.status_code == 422
 
-def test_run_wgx_audit_git_file_mode_specific_filename(tmp_path, monkeypatch):
+    # Oversized ID -> 422
+    res = client.post(
+        "/api/routine/preview",
+        json={"repo": "metarepo", "id": "a" * 65},
+        headers={"X-ACS-Actor-Token": "testsecret"}
+    )
+    assert res.status_code == 422
+
+def test_run_wgx_audit_git_file_mode_specific_filename(tmp_path, mock_run_table):
     """Test that file artifact mode works when only specific correlation-ID file exists."""
     repo_path = _mk_repo(tmp_path, "repo")
     corr_id = "specific-corr-id"
@@ -656,10 +817,7 @@ def test_run_wgx_audit_git_file_mode_specific_filename(tmp_path, monkeypatch):
         generic_path.unlink()
 
     # Mock run to return nothing useful in stdout
-    def _run(cmd, cwd, timeout=60, **kwargs):
-        return CmdResult(0, "some noisy stdout without path", "", cmd)
-
-    monkeypatch.setattr("panel.ops.run", _run)
+    mock_run_table(default=CmdResult(0, "some noisy stdout without path", "", []))
 
     result = run_wgx_audit_git("mock_repo", repo_path, corr_id, stdout_json=False)
     assert isinstance(result, AuditGit)
@@ -684,9 +842,7 @@ def test_run_audit_job_semantics_unit(monkeypatch, mock_get_repo):
         result_calls.append((jid, result))
 
     # Mock run_wgx_audit_git to directly return an AuditGit object with status="error"
-    mock_audit_data = json.loads(MOCK_AUDIT_JSON)
-    mock_audit_data["status"] = "error"
-    audit_obj = AuditGit(**mock_audit_data)
+    audit_obj = AuditGit(**{**MOCK_AUDIT_DICT, "status": "error"})
 
     def mock_run_wgx_audit_git(*args, **kwargs):
         return audit_obj
@@ -1,36 +1,131 @@
-from unittest.mock import MagicMock, patch
+from collections import defaultdict, namedtuple
+from contextlib import ExitStack
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
 
 from panel.app import get_remote_protocol, https_remote_to_ssh, execute_publish, PublishOptions
+from panel.repos import Repo
 from panel.runner import CmdResult
 
+MOCK_REPO = Repo(key="metarepo", path=Path("/tmp/mock"), display="heimgewebe/metarepo")
 
-def has_pr_create_head(call_args_list, expected_head, expected_base="main"):
-    for call in call_args_list:
-        cmd = call.args[0]
-        if cmd[:3] != ["gh", "pr", "create"]:
-            continue
-        if "--base" not in cmd or "--head" not in cmd:
-            continue
-        base_idx = cmd.index("--base")
-        head_idx = cmd.index("--head")
-        if base_idx + 1 >= len(cmd) or head_idx + 1 >= len(cmd):
-            continue
-        if cmd[base_idx + 1] != expected_base:
-            continue
-        if cmd[head_idx + 1] != expected_head:
-            continue
-        return True
-    return False
-
-
-def has_rev_list_count(call_args_list, expected_range):
+
+PrCreate = namedtuple("PrCreate", "head base")
+
+
+def index_calls(call_args_list) -> dict[tuple[str, ...], list[list[str]]]:
+    """Group the argv of recorded run() calls by their first three items."""
+    calls_by_prefix = defaultdict(list)
     for call in call_args_list:
         cmd = call.args[0]
-        if cmd[:3] != ["git", "rev-list", "--count"]:
-            continue
-        if len(cmd) > 3 and cmd[3] == expected_range:
-            return True
-    return False
+        calls_by_prefix[tuple(cmd[:3])].append(cmd)
+    return calls_by_prefix
+
+
+def parse_pr_create(cmd: list[str]) -> PrCreate:
+    # The first occurrence of a flag wins, matching list.index().
+    options: dict[str, str] = {}
+    for flag, value in zip(cmd, cmd[1:]):
+        options.setdefault(flag, value)
+    return PrCreate(options.get("--head"), options.get("--base"))
+
+
+def has_pr_create_head(calls_by_prefix, expected_head, expected_base="main"):
+    expected = PrCreate(expected_head, expected_base)
+    return any(
+        parse_pr_create(cmd) == expected
+        for cmd in calls_by_prefix.get(("gh", "pr", "create"), [])
+    )
+
+
+def has_rev_list_count(calls_by_prefix, expected_range):
+    return any(
+        len(cmd) > 3 and cmd[3] == expected_range
+        for cmd in calls_by_prefix.get(("git", "rev-list", "--count"), [])
+    )
+
+
+def _ok(stdout: str = "") -> CmdResult:
+    return CmdResult(code=0, stdout=stdout, stderr="", cmd=[])
+
+
+def _fail(stderr: str, code: int = 1) -> CmdResult:
+    return CmdResult(code=code, stdout="", stderr=stderr, cmd=[])
+
+
+# Happy-path answers for the publish flow, keyed by argv prefix (2-4 items).
+PUBLISH_ROUTES: dict[tuple[str, ...], CmdResult] = {
+    ("git", "ls-remote", "--heads"): _ok(),
+    ("gh", "--version"): _ok("gh version 2.0.0"),
+    ("gh", "auth", "status"): _ok("logged in"),
+    ("git", "remote", "get-url"): _ok("git@github.com:org/repo.git\n"),
+    ("git", "push"): _ok(),
+    ("git", "rev-parse", "--abbrev-ref", "--symbolic-full-name"): _ok("origin/feature\n"),
+    ("git", "fetch"): _ok(),
+    ("git", "rev-list", "--count"): _ok("1\n"),
+    ("gh", "pr", "create"): _fail("no pr"),
+}
+ROUTE_PREFIX_LENGTHS = sorted({len(key) for key in PUBLISH_ROUTES}, reverse=True)
+DEFAULT_RESULT = _ok()
+FEATURE_REFSPECS = ["main:refs/remotes/origin/main", "feature:refs/remotes/origin/feature"]
+
+
+def make_run_side_effect(overrides: dict[tuple[str, ...], CmdResult] | None = None):
+    """Mocked run() answering from PUBLISH_ROUTES (plus per-test overrides) by longest prefix."""
+    routes = {**PUBLISH_ROUTES, **(overrides or {})}
+
+    def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
+        for n in ROUTE_PREFIX_LENGTHS:
+            result = routes.get(tuple(cmd[:n]))
+            if result is not None:
+                return result
+        return DEFAULT_RESULT
+
+    return run_side_effect
+
+
+@pytest.fixture
+def publish_env():
+    """Patches execute_publish's collaborators once; tests adjust run routes and git state.
+
+    Results recorded singly or in batches are collected in order in ``results``.
+    """
+    env = SimpleNamespace(results=[])
+    with ExitStack() as stack:
+        enter = stack.enter_context
+        enter(patch("panel.app.get_repo", return_value=MOCK_REPO))
+        enter(patch("panel.app.is_valid_branch_name", return_value=True))
+        env.git_state = enter(patch("panel.app.get_git_state", return_value=("feature", "abc123")))
+        enter(patch("panel.app.git_status_porcelain", return_value=[]))
+        env.run = enter(patch("panel.app.run", side_effect=make_run_side_effect()))
+        enter(patch("panel.app.find_existing_pr_url", return_value=None))
+        enter(patch(
+            "panel.app.record_job_result",
+            side_effect=lambda _job, result: env.results.append(result),
+        ))
+        env.record_many = enter(patch(
+            "panel.app.record_job_results",
+            side_effect=lambda _job, results: env.results.extend(results),
+        ))
+        yield env
+
+
+def publish(env, overrides=None, branch="feature", job_id="job-1") -> bool:
+    if overrides is not None:
+        env.run.side_effect = make_run_side_effect(overrides)
+    return execute_publish(job_id, "corr-1", "metarepo", PublishOptions(branch=branch))
+
+
+def fetched_refspecs(env) -> list[list[str]]:
+    fetches = index_calls(env.run.call_args_list).get(("git", "fetch", "origin"), [])
+    return [cmd[3:5] for cmd in fetches]
+
+
+def has_result(env, action, ok) -> bool:
+    return any(result.action == action and result.ok is ok for result in env.results)
 
 
 def test_get_remote_protocol_detection() -> None:
@@ -48,423 +143,152 @@ def test_https_remote_to_ssh_github_only() -> None:
     assert https_remote_to_ssh("https://gitlab.com/org/repo.git") is None
 
 
-def test_execute_publish_no_commits_aborts_before_pr_create() -> None:
-    def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
-        if cmd[:3] == ["git", "ls-remote", "--heads"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["gh", "--version"]:
-            return CmdResult(code=0, stdout="gh version 2.0.0", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "auth", "status"]:
-            return CmdResult(code=0, stdout="logged in", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "remote", "get-url"]:
-            return CmdResult(code=0, stdout="git@github.com:org/repo.git\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "push"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:4] == ["git", "rev-parse", "--abbrev-ref", "--symbolic-full-name"]:
-            return CmdResult(code=0, stdout="origin/feature\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "fetch"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "rev-list", "--count"]:
-            return CmdResult(code=0, stdout="0\n", stderr="", cmd=list(cmd))
-        return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-
-    with patch("panel.app.get_repo") as mock_get_repo, \
-         patch("panel.app.is_valid_branch_name", return_value=True), \
-         patch("panel.app.get_git_state", return_value=("feature", "abc123")), \
-         patch("panel.app.git_status_porcelain", return_value=[]), \
-         patch("panel.app.run", side_effect=run_side_effect) as mock_run, \
-         patch("panel.app.record_job_result") as mock_record:
-        mock_get_repo.return_value = MagicMock(key="metarepo", path="/tmp/mock")
-
-        req = PublishOptions(branch="feature")
-        execute_publish("job-1", "corr-1", "metarepo", req)
-
-        results = [call.args[1] for call in mock_record.call_args_list]
-        assert any(result.action == "git.pr.precheck" and not result.ok for result in results)
-        assert any(
-            call.args[0][:5] == [
-                "git",
-                "fetch",
-                "origin",
-                "main:refs/remotes/origin/main",
-                "feature:refs/remotes/origin/feature",
-            ]
-            for call in mock_run.call_args_list
-        )
-        assert not any(
-            call.args[0][:3] == ["gh", "pr", "create"]
-            for call in mock_run.call_args_list
-        )
-
-
-def test_precheck_uses_origin_refs_and_fetches() -> None:
-    def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
-        if cmd[:3] == ["git", "ls-remote", "--heads"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["gh", "--version"]:
-            return CmdResult(code=0, stdout="gh version 2.0.0", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "auth", "status"]:
-            return CmdResult(code=0, stdout="logged in", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "remote", "get-url"]:
-            return CmdResult(code=0, stdout="git@github.com:org/repo.git\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "push"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:4] == ["git", "rev-parse", "--abbrev-ref", "--symbolic-full-name"]:
-            return CmdResult(code=0, stdout="origin/feature\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "fetch"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "rev-list", "--count"]:
-            return CmdResult(code=0, stdout="2\n", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "pr", "create"]:
-            return CmdResult(code=1, stdout="", stderr="no pr", cmd=list(cmd))
-        return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-
-    with patch("panel.app.get_repo") as mock_get_repo, \
-         patch("panel.app.is_valid_branch_name", return_value=True), \
-         patch("panel.app.get_git_state", return_value=("feature", "abc123")), \
-         patch("panel.app.git_status_porcelain", return_value=[]), \
-         patch("panel.app.run", side_effect=run_side_effect) as mock_run, \
-         patch("panel.app.find_existing_pr_url", return_value=None), \
-         patch("panel.app.record_job_result"):
-        mock_get_repo.return_value = MagicMock(key="metarepo", path="/tmp/mock")
-
-        req = PublishOptions(branch="feature")
-        execute_publish("job-1", "corr-1", "metarepo", req)
-
-        assert any(
-            call.args[0][:5] == [
-                "git",
-                "fetch",
-                "origin",
-                "main:refs/remotes/origin/main",
-                "feature:refs/remotes/origin/feature",
-            ]
-            for call in mock_run.call_args_list
-        )
-        assert has_pr_create_head(mock_run.call_args_list, "feature")
-
-
-def test_execute_publish_origin_upstream_uses_upstream_branch() -> None:
-    def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
-        if cmd[:3] == ["git", "ls-remote", "--heads"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["gh", "--version"]:
-            return CmdResult(code=0, stdout="gh version 2.0.0", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "auth", "status"]:
-            return CmdResult(code=0, stdout="logged in", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "remote", "get-url"]:
-            return CmdResult(code=0, stdout="git@github.com:org/repo.git\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "push"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:4] == ["git", "rev-parse", "--abbrev-ref", "--symbolic-full-name"]:
-            return CmdResult(code=0, stdout="origin/feature-remote\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "fetch"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "rev-list", "--count"]:
-            return CmdResult(code=0, stdout="1\n", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "pr", "create"]:
-            return CmdResult(code=1, stdout="", stderr="no pr", cmd=list(cmd))
-        return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-
-    with patch("panel.app.get_repo") as mock_get_repo, \
-         patch("panel.app.is_valid_branch_name", return_value=True), \
-         patch("panel.app.get_git_state", return_value=("feature-local", "abc123")), \
-         patch("panel.app.git_status_porcelain", return_value=[]), \
-         patch("panel.app.run", side_effect=run_side_effect) as mock_run, \
-         patch("panel.app.find_existing_pr_url", return_value=None), \
-         patch("panel.app.record_job_result"):
-        mock_get_repo.return_value = MagicMock(key="metarepo", path="/tmp/mock")
-
-        req = PublishOptions(branch="feature-local")
-        execute_publish("job-1", "corr-1", "metarepo", req)
-
-        assert any(
-            call.args[0][:5] == [
-                "git",
-                "fetch",
-                "origin",
-                "main:refs/remotes/origin/main",
-                "feature-remote:refs/remotes/origin/feature-remote",
-            ]
-            for call in mock_run.call_args_list
-        )
-        assert has_pr_create_head(mock_run.call_args_list, "feature-remote")
-        assert has_rev_list_count(mock_run.call_args_list, "origin/main..origin/feature-remote")
-
-
-def test_execute_publish_upstream_fallback_uses_head_branch() -> None:
-    def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
-        if cmd[:3] == ["git", "ls-remote", "--heads"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["gh", "--version"]:
-            return CmdResult(code=0, stdout="gh version 2.0.0", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "auth", "status"]:
-            return CmdResult(code=0, stdout="logged in", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "remote", "get-url"]:
-            return CmdResult(code=0, stdout="git@github.com:org/repo.git\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "push"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:4] == ["git", "rev-parse", "--abbrev-ref", "--symbolic-full-name"]:
-            return CmdResult(code=1, stdout="", stderr="no upstream", cmd=list(cmd))
-        if cmd[:2] == ["git", "fetch"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "rev-list", "--count"]:
-            return CmdResult(code=0, stdout="1\n", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "pr", "create"]:
-            return CmdResult(code=1, stdout="", stderr="no pr", cmd=list(cmd))
-        return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-
-    with patch("panel.app.get_repo") as mock_get_repo, \
-         patch("panel.app.is_valid_branch_name", return_value=True), \
-         patch("panel.app.get_git_state", return_value=("feature", "abc123")), \
-         patch("panel.app.git_status_porcelain", return_value=[]), \
-         patch("panel.app.run", side_effect=run_side_effect) as mock_run, \
-         patch("panel.app.find_existing_pr_url", return_value=None), \
-         patch("panel.app.record_job_result") as mock_record:
-        mock_get_repo.return_value = MagicMock(key="metarepo", path="/tmp/mock")
-
-        req = PublishOptions(branch="feature")
-        execute_publish("job-1", "corr-1", "metarepo", req)
-
-        results = [call.args[1] for call in mock_record.call_args_list]
-        assert any(
-            result.action == "git.branch.upstream"
-            and not result.ok
-            and result.error_kind == "upstream_unavailable"
-            and "Upstream not available" in result.message
-            for result in results
-        )
-        assert any(
-            call.args[0][:5] == [
-                "git",
-                "fetch",
-                "origin",
-                "main:refs/remotes/origin/main",
-                "feature:refs/remotes/origin/feature",
-            ]
-            for call in mock_run.call_args_list
-        )
-
-
-def test_execute_publish_non_origin_upstream_message_uses_head_branch() -> None:
-    def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
-        if cmd[:3] == ["git", "ls-remote", "--heads"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["gh", "--version"]:
-            return CmdResult(code=0, stdout="gh version 2.0.0", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "auth", "status"]:
-            return CmdResult(code=0, stdout="logged in", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "remote", "get-url"]:
-            return CmdResult(code=0, stdout="git@github.com:org/repo.git\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "push"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:4] == ["git", "rev-parse", "--abbrev-ref", "--symbolic-full-name"]:
-            return CmdResult(code=0, stdout="upstream/feature\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "fetch"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "rev-list", "--count"]:
-            return CmdResult(code=0, stdout="1\n", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "pr", "create"]:
-            return CmdResult(code=1, stdout="", stderr="no pr", cmd=list(cmd))
-        return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-
-    with patch("panel.app.get_repo") as mock_get_repo, \
-         patch("panel.app.is_valid_branch_name", return_value=True), \
-         patch("panel.app.get_git_state", return_value=("feature", "abc123")), \
-         patch("panel.app.git_status_porcelain", return_value=[]), \
-         patch("panel.app.run", side_effect=run_side_effect) as mock_run, \
-         patch("panel.app.find_existing_pr_url", return_value=None), \
-         patch("panel.app.record_job_result") as mock_record:
-        mock_get_repo.return_value = MagicMock(key="metarepo", path="/tmp/mock")
-
-        req = PublishOptions(branch="feature")
-        execute_publish("job-1", "corr-1", "metarepo", req)
-
-        results = [call.args[1] for call in mock_record.call_args_list]
-        assert any(
-            result.action == "git.branch.upstream"
-            and result.ok
-            and result.error_kind == "upstream_non_origin"
-            and "non-origin" in result.message
-            for result in results
-        )
-        assert any(
-            call.args[0][:5] == [
-                "git",
-                "fetch",
-                "origin",
-                "main:refs/remotes/origin/main",
-                "feature:refs/remotes/origin/feature",
-            ]
-            for call in mock_run.call_args_list
-        )
-
-
-def test_execute_publish_empty_upstream_message() -> None:
-    def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
-        if cmd[:3] == ["git", "ls-remote", "--heads"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["gh", "--version"]:
-            return CmdResult(code=0, stdout="gh version 2.0.0", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "auth", "status"]:
-            return CmdResult(code=0, stdout="logged in", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "remote", "get-url"]:
-            return CmdResult(code=0, stdout="git@github.com:org/repo.git\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "push"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:4] == ["git", "rev-parse", "--abbrev-ref", "--symbolic-full-name"]:
-            return CmdResult(code=0, stdout="\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "fetch"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "rev-list", "--count"]:
-            return CmdResult(code=0, stdout="1\n", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "pr", "create"]:
-            return CmdResult(code=1, stdout="", stderr="no pr", cmd=list(cmd))
-        return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-
-    with patch("panel.app.get_repo") as mock_get_repo, \
-         patch("panel.app.is_valid_branch_name", return_value=True), \
-         patch("panel.app.get_git_state", return_value=("feature", "abc123")), \
-         patch("panel.app.git_status_porcelain", return_value=[]), \
-         patch("panel.app.run", side_effect=run_side_effect), \
-         patch("panel.app.find_existing_pr_url", return_value=None), \
-         patch("panel.app.record_job_result") as mock_record:
-        mock_get_repo.return_value = MagicMock(key="metarepo", path="/tmp/mock")
-
-        req = PublishOptions(branch="feature")
-        execute_publish("job-1", "corr-1", "metarepo", req)
-
-        results = [call.args[1] for call in mock_record.call_args_list]
-        assert any(
-            result.action == "git.branch.upstream"
-            and result.ok
-            and result.error_kind == "upstream_missing"
-            and "No upstream configured" in result.message
-            for result in results
-        )
-
-
-def test_execute_publish_rewrites_https_remote() -> None:
-    def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
-        if cmd[:3] == ["git", "ls-remote", "--heads"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["gh", "--version"]:
-            return CmdResult(code=0, stdout="gh version 2.0.0", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "auth", "status"]:
-            return CmdResult(code=0, stdout="logged in", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "remote", "get-url"]:
-            return CmdResult(code=0, stdout="https://github.com/org/repo.git\n", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "remote", "set-url"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "push"]:
-            return CmdResult(code=1, stdout="", stderr="push failed", cmd=list(cmd))
-        return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-
-    with patch("panel.app.get_repo") as mock_get_repo, \
-         patch("panel.app.is_valid_branch_name", return_value=True), \
-         patch("panel.app.get_git_state", return_value=("feature", "abc123")), \
-         patch("panel.app.git_status_porcelain", return_value=[]), \
-         patch("panel.app.run", side_effect=run_side_effect) as mock_run, \
-         patch("panel.app.record_job_result") as mock_record:
-        mock_get_repo.return_value = MagicMock(key="metarepo", path="/tmp/mock")
-
-        req = PublishOptions(branch="feature")
-        execute_publish("job-1", "corr-1", "metarepo", req)
-
-        calls = [call.args[1] for call in mock_record.call_args_list]
-        assert any(result.action == "git.remote.rewrite" and result.ok for result in calls)
-        assert any(result.action == "git.push" and not result.ok for result in calls)
-        assert any(call.args[0] == ["git", "remote", "set-url", "origin", "git@github.com:org/repo.git"]
-                   for call in mock_run.call_args_list)
-
-
-def test_execute_publish_fetch_failure_aborts() -> None:
-    def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
-        if cmd[:3] == ["git", "ls-remote", "--heads"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["gh", "--version"]:
-            return CmdResult(code=0, stdout="gh version 2.0.0", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "auth", "status"]:
-            return CmdResult(code=0, stdout="logged in", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "remote", "get-url"]:
-            return CmdResult(code=0, stdout="git@github.com:org/repo.git\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "push"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:4] == ["git", "rev-parse", "--abbrev-ref", "--symbolic-full-name"]:
-            return CmdResult(code=0, stdout="origin/feature\n", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["git", "fetch"]:
-            return CmdResult(code=1, stdout="", stderr="fetch failed", cmd=list(cmd))
-        return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-
-    with patch("panel.app.get_repo") as mock_get_repo, \
-         patch("panel.app.is_valid_branch_name", return_value=True), \
-         patch("panel.app.get_git_state", return_value=("feature", "abc123")), \
-         patch("panel.app.git_status_porcelain", return_value=[]), \
-         patch("panel.app.run", side_effect=run_side_effect) as mock_run, \
-         patch("panel.app.record_job_result") as mock_record:
-        mock_get_repo.return_value = MagicMock(key="metarepo", path="/tmp/mock")
-
-        req = PublishOptions(branch="feature")
-        execute_publish("job-1", "corr-1", "metarepo", req)
-
-        results = [call.args[1] for call in mock_record.call_args_list]
-        assert any(result.action == "git.fetch" and not result.ok for result in results)
-        assert not any(
-            call.args[0][:3] == ["gh", "pr", "create"]
-            for call in mock_run.call_args_list
-        )
-
-
-def test_execute_publish_missing_gh() -> None:
-    def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
-        if cmd[:3] == ["git", "ls-remote", "--heads"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["gh", "--version"]:
-            return CmdResult(code=127, stdout="", stderr="command not found", cmd=list(cmd))
-        return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
+def test_execute_publish_no_commits_aborts_before_pr_create(publish_env) -> None:
+    publish(publish_env, {("git", "rev-list", "--count"): _ok("0\n")})
+
+    assert has_result(publish_env, "git.pr.precheck", ok=False)
+    assert FEATURE_REFSPECS in fetched_refspecs(publish_env)
+    assert ("gh", "pr", "create") not in index_calls(publish_env.run.call_args_list)
+
+
+def test_precheck_uses_origin_refs_and_fetches(publish_env) -> None:
+    publish(publish_env, {("git", "rev-list", "--count"): _ok("2\n")})
+
+    assert FEATURE_REFSPECS in fetched_refspecs(publish_env)
+    assert has_pr_create_head(index_calls(publish_env.run.call_args_list), "feature")
+    # Already on the branch: HEAD is resolved once for the whole publish
+    assert publish_env.git_state.call_count == 1
+
+
+def test_execute_publish_origin_upstream_uses_upstream_branch(publish_env) -> None:
+    publish_env.git_state.return_value = ("feature-local", "abc123")
+    publish(
+        publish_env,
+        {
+            ("git", "rev-parse", "--abbrev-ref", "--symbolic-full-name"):
+                _ok("origin/feature-remote\n"),
+        },
+        branch="feature-local",
+    )
+
+    assert [
+        "main:refs/remotes/origin/main",
+        "feature-remote:refs/remotes/origin/feature-remote",
+    ] in fetched_refspecs(publish_env)
+    calls_by_prefix = index_calls(publish_env.run.call_args_list)
+    assert has_pr_create_head(calls_by_prefix, "feature-remote")
+    assert has_rev_list_count(calls_by_prefix, "origin/main..origin/feature-remote")
+
+
+@pytest.mark.parametrize(
+    ("upstream", "ok", "error_kind", "message"),
+    [
+        (_fail("no upstream"), False, "upstream_unavailable", "Upstream not available"),
+        (_ok("upstream/feature\n"), True, "upstream_non_origin", "non-origin"),
+        (_ok("\n"), True, "upstream_missing", "No upstream configured"),
+    ],
+    ids=["unavailable", "non-origin", "empty"],
+)
+def test_execute_publish_upstream_messages_use_head_branch(
+    publish_env, upstream, ok, error_kind, message
+) -> None:
+    publish(publish_env, {("git", "rev-parse", "--abbrev-ref", "--symbolic-full-name"): upstream})
+
+    assert any(
+        result.action == "git.branch.upstream"
+        and result.ok is ok
+        and result.error_kind == error_kind
+        and message in result.message
+        for result in publish_env.results
+    )
+    assert FEATURE_REFSPECS in fetched_refspecs(publish_env)
+
+
+def test_execute_publish_rewrites_https_remote(publish_env) -> None:
+    publish(publish_env, {
+        ("git", "remote", "get-url"): _ok("https://github.com/org/repo.git\n"),
+        ("git", "push"): _fail("push failed"),
+    })
+
+    assert has_result(publish_env, "git.remote.rewrite", ok=True)
+    assert has_result(publish_env, "git.push", ok=False)
+    assert any(call.args[0] == ["git", "remote", "set-url", "origin", "git@github.com:org/repo.git"]
+               for call in publish_env.run.call_args_list)
+
 
-    with patch("panel.app.get_repo") as mock_get_repo, \
-         patch("panel.app.is_valid_branch_name", return_value=True), \
-         patch("panel.app.get_git_state", return_value=("feature", "abc123")), \
-         patch("panel.app.run", side_effect=run_side_effect), \
-         patch("panel.app.record_job_result") as mock_record:
-        mock_get_repo.return_value = MagicMock(key="metarepo", path="/tmp/mock")
+def test_execute_publish_fetch_failure_aborts(publish_env) -> None:
+    publish(publish_env, {("git", "fetch"): _fail("fetch failed")})
 
-        req = PublishOptions(branch="feature")
-        execute_publish("job-1", "corr-1", "metarepo", req)
+    assert has_result(publish_env, "git.fetch", ok=False)
+    assert ("gh", "pr", "create") not in index_calls(publish_env.run.call_args_list)
 
-        calls = [call.args[1] for call in mock_record.call_args_list]
-        assert any(result.action == "gh.version" and not result.ok for result in calls)
 
+def test_execute_publish_missing_gh(publish_env) -> None:
+    publish(publish_env, {("gh", "--version"): _fail("command not found", code=127)})
 
-def test_execute_publish_https_remote_rewrite_disabled(monkeypatch) -> None:
+    # The passed remote check and the failed gh check are recorded as one batch
+    publish_env.record_many.assert_called_once()
+    assert [(result.action, result.ok) for result in publish_env.results] == [
+        ("git.remote", True),
+        ("gh.version", False),
+    ]
+
+
+def test_execute_publish_remote_check_asks_for_publish_branch_only(publish_env) -> None:
+    publish(publish_env)
+
+    assert index_calls(publish_env.run.call_args_list)[("git", "ls-remote", "--heads")] == [
+        ["git", "ls-remote", "--heads", "origin", "refs/heads/feature"]
+    ]
+
+
+def test_execute_publish_preflight_reports_in_order_and_stops_at_first_failure(publish_env) -> None:
+    unreachable = {("git", "ls-remote", "--heads"): _fail("unreachable", code=128)}
+    assert not publish(publish_env, unreachable)
+
+    # gh checks may have run concurrently, but only the failing remote check is reported
+    assert [result.action for result in publish_env.results] == ["git.remote"]
+
+
+@pytest.mark.parametrize("token_env", ["GH_TOKEN", "GITHUB_TOKEN"])
+def test_execute_publish_token_env_skips_gh_auth_status(
+    publish_env, monkeypatch, token_env
+) -> None:
+    monkeypatch.setenv(token_env, "secret")
+
+    publish(publish_env)
+
+    assert ("gh", "auth", "status") not in index_calls(publish_env.run.call_args_list)
+    auth = next(result for result in publish_env.results if result.action == "gh.auth")
+    assert auth.ok
+    assert token_env in auth.message
+
+
+def test_execute_publish_https_remote_rewrite_disabled(publish_env, monkeypatch) -> None:
     monkeypatch.setenv("ACS_PUBLISH_REWRITE_REMOTE", "0")
 
-    def run_side_effect(cmd, cwd, timeout=60, env=None, input_text=None):
-        if cmd[:3] == ["git", "ls-remote", "--heads"]:
-            return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-        if cmd[:2] == ["gh", "--version"]:
-            return CmdResult(code=0, stdout="gh 2.0.0", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["gh", "auth", "status"]:
-            return CmdResult(code=0, stdout="logged in", stderr="", cmd=list(cmd))
-        if cmd[:3] == ["git", "remote", "get-url"]:
-            return CmdResult(code=0, stdout="https://github.com/org/repo.git\n", stderr="", cmd=list(cmd))
-        return CmdResult(code=0, stdout="", stderr="", cmd=list(cmd))
-
-    with patch("panel.app.get_repo") as mock_get_repo, \
-         patch("panel.app.is_valid_branch_name", return_value=True), \
-         patch("panel.app.get_git_state", return_value=("feature", "abc123")), \
-         patch("panel.app.git_status_porcelain", return_value=[]), \
-         patch("panel.app.run", side_effect=run_side_effect) as mock_run, \
-         patch("panel.app.record_job_result") as mock_record:
-        mock_get_repo.return_value = MagicMock(key="metarepo", path="/tmp/mock")
-
-        req = PublishOptions(branch="feature")
-        execute_publish("job-1", "corr-1", "metarepo", req)
-
-        results = [call.args[1] for call in mock_record.call_args_list]
-        assert any(result.action == "git.remote.protocol" and not result.ok for result in results)
-        assert not any(
-            call.args[0][:3] == ["git", "remote", "set-url"]
-            for call in mock_run.call_args_list
-        )
+    publish(publish_env, {("git", "remote", "get-url"): _ok("https://github.com/org/repo.git\n")})
+
+    assert has_result(publish_env, "git.remote.protocol", ok=False)
+    assert ("git", "remote", "set-url") not in index_calls(publish_env.run.call_args_list)
+
+
+def test_execute_publish_reuses_successful_preflight_checks(publish_env) -> None:
+    https_remote = {
+        ("git", "remote", "get-url"): _ok("https://github.com/org/repo.git\n"),
+        ("git", "push"): _fail("push failed"),
+    }
+    missing_gh = {("gh", "--version"): _fail("command not found", code=127)}
+
+    publish(publish_env, {**https_remote, **missing_gh})
+    # Failed checks are not cached: the next publish retries once gh is installed
+    publish(publish_env, https_remote, job_id="job-2")
+    # origin switched to ssh outside the panel: it is read fresh, so no rewrite happens
+    publish(publish_env, {("git", "push"): _fail("push failed")}, job_id="job-3")
+
+    calls_by_prefix = index_calls(publish_env.run.call_args_list)
+    assert len(calls_by_prefix[("gh", "--version")]) == 2
+    assert len(calls_by_prefix[("gh", "auth", "status")]) == 1
+    assert len(calls_by_prefix[("git", "ls-remote", "--heads")]) == 3
+    assert len(calls_by_prefix[("git", "remote", "get-url")]) == 2
+    assert len(calls_by_prefix[("git", "remote", "set-url")]) == 1
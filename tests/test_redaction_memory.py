@@ -1,5 +1,5 @@
 import json
-from panel.app import record_job_result, JobState, ActionResult, JOBS, JOB_LOCK
+from panel.app import record_job_result, record_job_results, JobState, ActionResult, JOBS, JOB_LOCK
 from panel.logging import redact_secrets
 
 def test_record_job_result_redaction_in_memory():
@@ -43,6 +43,44 @@ def test_record_job_result_redaction_in_memory():
         assert "[redacted]" in recorded_result.message
         assert secret_token not in recorded_result.message
 
+        # 3. The log line is the JSON form of the stored result
+        assert log_entry == recorded_result.model_dump()
+
+    finally:
+        with JOB_LOCK:
+            JOBS.pop(job_id, None)
+
+
+def test_record_job_results_batch_is_redacted_and_ordered():
+    job_id = "test-redaction-batch-job"
+    with JOB_LOCK:
+        JOBS[job_id] = JobState(job_id=job_id, status="running")
+
+    try:
+        secret_token = "ghp_SECRET12345678901234567890"
+        results = [
+            ActionResult(
+                ok=True,
+                action=f"step.{i}",
+                repo="repo",
+                correlation_id="123",
+                ts="2023-01-01",
+                stdout=f"step {i} {secret_token}",
+            )
+            for i in range(3)
+        ]
+
+        record_job_results(job_id, results)
+
+        job = JOBS[job_id]
+        assert len(job.results) == 3
+        assert len(job.log_lines) == 3
+        expected_actions = ["step.0", "step.1", "step.2"]
+        assert [r.action for r in job.results] == expected_actions
+        assert [json.loads(line)["action"] for line in job.log_lines] == expected_actions
+        assert all(secret_token not in r.stdout for r in job.results)
+        assert all(secret_token not in line for line in job.log_lines)
+
     finally:
         with JOB_LOCK:
             JOBS.pop(job_id, None)
@@ -1,18 +1,12 @@
-from pathlib import Path
+def test_repo_placeholder_option_present(index_html: str) -> None:
+    assert 'option value=""' in index_html
+    assert "Repo auswählen" in index_html
 
 
-def test_repo_placeholder_option_present() -> None:
-    html = Path("panel/templates/index.html").read_text(encoding="utf-8")
-    assert 'option value=""' in html
-    assert "Repo auswählen" in html
+def test_publish_button_requires_repo_flag(index_html: str) -> None:
+    assert 'data-repo-required="true">Publish (Push + PR)' in index_html
 
 
-def test_publish_button_requires_repo_flag() -> None:
-    html = Path("panel/templates/index.html").read_text(encoding="utf-8")
-    assert 'data-repo-required="true">Publish (Push + PR)' in html
-
-
-def test_publish_uses_repo_query_param() -> None:
-    html = Path("panel/templates/index.html").read_text(encoding="utf-8")
-    assert "/api/git/publish?repo=" in html
-    assert "ensureRepo" in html
+def test_publish_uses_repo_query_param(index_html: str) -> None:
+    assert "/api/git/publish?repo=" in index_html
+    assert "ensureRepo" in index_html
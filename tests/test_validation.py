@@ -1,33 +1,49 @@
+import pytest
+
 from panel.app import is_valid_branch_name
 
-def test_valid_branch_names():
-    assert is_valid_branch_name("feature/abc")
-    assert is_valid_branch_name("bugfix-123")
-    assert is_valid_branch_name("main")
-    assert is_valid_branch_name("v1.0.0")
-    assert is_valid_branch_name("user/name/repo")
 
-def test_invalid_branch_names():
-    # Empty or space
-    assert not is_valid_branch_name("")
-    assert not is_valid_branch_name("feature abc")
+@pytest.mark.parametrize(
+    "name",
+    ["feature/abc", "bugfix-123", "main", "v1.0.0", "user/name/repo", "a" * 255],
+)
+def test_valid_branch_names(name):
+    assert is_valid_branch_name(name)
 
-    # Invalid characters
-    assert not is_valid_branch_name("feature\\abc")
-    assert not is_valid_branch_name("feature:abc")
-    assert not is_valid_branch_name("feature?abc")
-    assert not is_valid_branch_name("feature*abc")
-    assert not is_valid_branch_name("feature[abc")
-    assert not is_valid_branch_name("feature@{abc")
 
-    # Git restrictions
-    assert not is_valid_branch_name("-start-dash")
-    assert not is_valid_branch_name("end-lock.lock")
-    assert not is_valid_branch_name("path/../traversal")
-    assert not is_valid_branch_name("feature..abc")
-    assert not is_valid_branch_name("feature//abc")
-    assert not is_valid_branch_name("feature/./abc")
-    assert not is_valid_branch_name("@")
+@pytest.mark.parametrize(
+    "name",
+    [
+        # Empty, too long or whitespace
+        "",
+        "a" * 256,
+        "feature abc",
+        "feature\tabc",
+        # Invalid characters
+        "feature\\abc",
+        "feature:abc",
+        "feature?abc",
+        "feature*abc",
+        "feature[abc",
+        "feature@{abc",
+        "feature~1",
+        "feature/\u00fcmlaut",
+        # Git restrictions
+        "-start-dash",
+        ".hidden",
+        "/leading-slash",
+        "trailing-slash/",
+        "trailing-dot.",
+        "end-lock.lock",
+        "path/../traversal",
+        "feature..abc",
+        "feature//abc",
+        "feature/./abc",
+        "@",
+        # Backslash specifically (was inconsistent before)
+        "foo\\bar",
+    ],
+)
+def test_invalid_branch_names(name):
+    assert not is_valid_branch_name(name)
 
-    # Backslash specifically (was inconsistent before)
-    assert not is_valid_branch_name("foo\\bar")